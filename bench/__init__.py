@@ -0,0 +1,31 @@
+import os
+import pathlib
+import tempfile
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+FIXTURES_DIR = ROOT / "bench" / "fixtures"
+TMP_DIR = pathlib.Path(tempfile.mkdtemp(prefix="wos-bench-"))
+
+# src.main and src.podcast read their configuration at import time
+os.environ.setdefault("CONFIG_DIR", str(ROOT / "config"))
+os.environ.setdefault("WEB_DIR", str(ROOT / "web"))
+os.environ.setdefault("DB_DIR", str(TMP_DIR / "db"))
+os.environ.setdefault("SAFE_QUOTA_MARGIN", "0")
+os.environ.setdefault("VOICES_JSON", str(ROOT / "config" / "elevenlabs.json"))
+os.environ.setdefault("MONGODB_DOMAIN", "localhost")
+os.environ.setdefault("NAME", "Benchmark")
+os.environ.setdefault("DESCRIPTION", "Benchmark")
+os.environ.setdefault("CATEGORY", '["Leisure", "Hobbies"]')
+os.environ.setdefault("LANGUAGE", "en-gb")
+os.environ.setdefault("OWNER", '{"name": "Owner", "email": "owner@example.com"}')
+os.environ.setdefault("AUTHOR", '{"name": "Author", "email": "author@example.com"}')
+os.environ.setdefault("URL", "https://podcast.example.com")
+os.environ.setdefault("EPISODE_URL", "https://podcast.example.com")
+os.environ.setdefault("WEB", "https://example.com")
+os.environ.setdefault("ART", "https://example.com/art.png")
+os.environ.setdefault("EPISODE_LINK_BASE", "https://example.com/empire-wiki/")
+os.environ.setdefault("MANUSCRIPT_FILTER_GROUP", "https://example.com/empire-wiki")
+os.environ.setdefault("MANUSCRIPT_FULL_TYPE_CATEGORY", "Recent history")
+os.environ.setdefault("CHAPTER_SEGMENT_TYPE", "h2")
+
+pathlib.Path(os.environ["DB_DIR"]).mkdir(parents=True, exist_ok=True)
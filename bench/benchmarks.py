@@ -0,0 +1,322 @@
+"""Offline micro-benchmarks of the generation hot paths.
+
+Everything runs on the fixtures in bench/fixtures and on synthetic data, so
+no network, ElevenLabs key or MongoDB is needed. Run from the repository
+root:
+
+    python -m bench.benchmarks                        # print JSON results
+    python -m bench.benchmarks --save baseline.json   # save them
+    python -m bench.benchmarks --compare baseline.json
+
+With --compare, a table of the changes is printed and the exit status is
+non-zero if any benchmark got slower than --threshold times the baseline.
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import typing
+
+import bs4
+
+from src import alignment, main, mp3
+
+from . import FIXTURES_DIR, ROOT, TMP_DIR
+
+Setup = typing.Callable[[], typing.Callable[[], object]]
+BENCHMARKS: dict[str, Setup] = {}
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono: what ElevenLabs sends
+MP3_HEADER = mp3.parse_header(b"\xff\xfb\x90\xc0", 0)
+assert MP3_HEADER
+
+
+def benchmark(name: str) -> typing.Callable[[Setup], Setup]:
+    """Register `setup`, which prepares the data and returns the function to
+    time."""
+
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+def fixtures() -> list[str]:
+    return [p.read_text() for p in sorted(FIXTURES_DIR.glob("*.html"))]
+
+
+def fixture_contents() -> list[bs4.Tag]:
+    contents = []
+    for html in fixtures():
+        soup = bs4.BeautifulSoup(html, "lxml", parse_only=main.ARTICLE_STRAINER)
+        content = soup.find(id="mw-content-text")
+        assert isinstance(content, bs4.Tag)
+        while len(list(content.children)) == 1:
+            content = list(content.children)[0]  # type: ignore
+        contents.append(content)
+    return contents
+
+
+def synthetic_chunks(words: int, seed: int = 0) -> list[dict]:
+    """Character timings shaped like ElevenLabs alignment chunks."""
+    rng = random.Random(seed)
+    text = " ".join(
+        rng.choice(["the", "Empire", "Year", "of", "Senate", "383", "Highguard"])
+        for _ in range(words)
+    )
+    chunks = []
+    for i in range(0, len(text), 200):
+        chars = list(text[i : i + 200])
+        durations = [rng.randint(20, 120) for _ in chars]
+        starts = [sum(durations[:j]) for j in range(len(chars))]
+        chunks.append(
+            {"chars": chars, "charStartTimesMs": starts, "charDurationsMs": durations}
+        )
+    return chunks
+
+
+def synthetic_mp3(seconds: float) -> bytes:
+    assert MP3_HEADER
+    frames = round(seconds * MP3_HEADER.sample_rate / MP3_HEADER.samples)
+    return mp3.silent_frame(MP3_HEADER) * frames
+
+
+@benchmark("parse_article")
+def bench_parse_article() -> typing.Callable[[], object]:
+    pages = fixtures()
+    return lambda: [main.parse_article(html) for html in pages]
+
+
+@benchmark("content_to_sections")
+def bench_content_to_sections() -> typing.Callable[[], object]:
+    contents = fixture_contents()
+    return lambda: [list(main.content_to_sections(c)) for c in contents]
+
+
+@benchmark("text_to_spans")
+def bench_text_to_spans() -> typing.Callable[[], object]:
+    texts = [c.text for c in fixture_contents()]
+    return lambda: [main.text_to_spans(t) for t in texts]
+
+
+@benchmark("alignment_group_words")
+def bench_alignment_group_words() -> typing.Callable[[], object]:
+    chunks = synthetic_chunks(2000)
+    return lambda: alignment.Alignment.from_chunks(chunks, main.MIN_TIME * 1000)
+
+
+@benchmark("alignment_post_replace")
+def bench_alignment_post_replace() -> typing.Callable[[], object]:
+    words = alignment.Alignment.from_chunks(
+        synthetic_chunks(2000), main.MIN_TIME * 1000
+    )
+    return lambda: words.merge(main.POST_REPLACE, main.MIN_TIME * 1000).to_json()
+
+
+@benchmark("alignment_list_merge")
+def bench_alignment_list_merge() -> typing.Callable[[], object]:
+    items = [f"item{i} of the list {i}" for i in range(300)]
+    words = alignment.Alignment.from_json(
+        [
+            {"text": w, "start": i * 100, "length": 100}
+            for i, w in enumerate(" ".join(items).split())
+        ]
+    )
+    rules = [alignment.Rule(s.split(), s) for s in items]
+    return lambda: words.merge(rules, main.MIN_TIME * 1000).to_json()
+
+
+@benchmark("complete_audio_100_sections")
+def bench_complete_audio() -> typing.Callable[[], object]:
+    rng = random.Random(0)
+    audio_dir = main.DB_DIR / "bench" / "sections"
+    audio_dir.mkdir(parents=True, exist_ok=True)
+    sections = []
+    for i in range(100):
+        path = audio_dir / f"{i}.mp3"
+        path.write_bytes(synthetic_mp3(rng.uniform(2, 20)))
+        sections.append(
+            {
+                "section_type": rng.choice(["h2", "p", "p", "p", "ul", "cite"]),
+                "spans": [{"text": f"Section {i}"}],
+                "audio_url": main.store_url(path),
+            }
+        )
+    outro = audio_dir / "outro.mp3"
+    outro.write_bytes(synthetic_mp3(6))
+    manuscript = {
+        "title": "Benchmark",
+        "sections": sections,
+        "outro": {"audio_url": main.store_url(outro)},
+    }
+    return lambda: main.build_complete_audio(manuscript, io.BytesIO())
+
+
+def synthetic_catalog(n: int) -> list[dict]:
+    rng = random.Random(0)
+    catalog = []
+    for i in range(n):
+        created = datetime.datetime(2015, 1, 1) + datetime.timedelta(days=i % 3000)
+        catalog.append(
+            {
+                "_id": f"Article_{i:05}_{rng.choice(['Senate', 'Synod', 'Bourse'])}",
+                "title": f"Article {i}",
+                "state": rng.choice(["done"] * 9 + ["generating"]),
+                "group": "https://example.com/empire-wiki",
+                "categories": rng.sample(["Recent history", "Nations", "Senate"], 2),
+                "img": None,
+                "created": created,
+                "lastmod": created + datetime.timedelta(days=rng.randint(0, 400)),
+                "sections": [
+                    {
+                        "section_type": rng.choice(["h2", "p", "p", "ul"]),
+                        "spans": [
+                            {"text": w}
+                            for w in f"Paragraph {j} of article {i} about the Empire".split()
+                        ],
+                    }
+                    for j in range(30)
+                ],
+            }
+        )
+    return catalog
+
+
+@benchmark("sitemap_5000_articles")
+def bench_sitemap() -> typing.Callable[[], object]:
+    catalog = sorted(synthetic_catalog(5000), key=lambda a: a["_id"])
+    return lambda: main.build_sitemap(catalog)
+
+
+@benchmark("podcast_get_episode_200")
+def bench_get_episode() -> typing.Callable[[], object]:
+    with contextlib.chdir(TMP_DIR):  # podcast creates ./metadata on import
+        from src import podcast
+
+    audio_path = main.DB_DIR / "bench" / "episode.mp3"
+    audio_path.parent.mkdir(parents=True, exist_ok=True)
+    # Tagged the way the generator tags complete audio
+    audio_path.write_bytes(main.audio_tag("Bench", [], 600) + synthetic_mp3(600))
+    catalog = synthetic_catalog(200)
+    for manuscript in catalog:
+        manuscript["complete_audio_url"] = main.store_url(audio_path)
+    return lambda: [podcast.get_episode(m) for m in catalog]
+
+
+def measure(fn: typing.Callable[[], object], repeat: int, min_time: float) -> dict:
+    fn()  # warm up
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+    runs = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - start) / number)
+    return {
+        "min": min(runs),
+        "median": statistics.median(runs),
+        "stdev": statistics.stdev(runs) if len(runs) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    regressions = 0
+    print(f"{'benchmark':32} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            print(f"{name:32} {'-':>12} {result['min'] * 1000:10.3f}ms {'new':>8}")
+            continue
+        ratio = result["min"] / base["min"]
+        flag = ""
+        if ratio > threshold:
+            regressions += 1
+            flag = "  SLOWER"
+        print(
+            f"{name:32} {base['min'] * 1000:10.3f}ms {result['min'] * 1000:10.3f}ms "
+            f"{ratio:7.2f}x{flag}"
+        )
+    return regressions
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("-k", "--filter", help="only run benchmarks containing this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-time", type=float, default=0.2, help="seconds per timed run"
+    )
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="compare with a saved JSON baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio that counts as a regression with --compare",
+    )
+    args = parser.parse_args()
+
+    results: dict = {
+        "meta": {
+            "date": datetime.datetime.now(datetime.UTC).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "benchmarks": {},
+    }
+    for name, setup in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        print(f"running {name}", file=sys.stderr)
+        results["benchmarks"][name] = measure(setup(), args.repeat, args.min_time)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, args.threshold) else 0
+    if not args.save:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
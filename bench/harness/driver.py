@@ -0,0 +1,315 @@
+"""End-to-end throughput run of the generator against local stand-ins.
+
+Starts the fake ElevenLabs and wiki servers and the generator app (uvicorn)
+with its own config, audio directory and MongoDB database. It then requests
+N new articles concurrently through /api/manuscript and watches MongoDB
+until every article has its complete audio. It reports articles/hour,
+request and article latency, per-stage latency from the pipeline's stats
+collection, queue depth over time, and what the fake servers saw.
+
+Needs a MongoDB server; only the database named by --database is touched
+(and dropped first). Run from the repository root:
+
+    python -m bench.harness.driver --articles 50 --mongodb localhost \\
+        --el-latency 0.5 --el-errors system_busy=0.02 --save run.json
+
+Extra generator settings (TTS_ARTICLES, PARSER_WORKERS, ...) are passed on
+from the environment.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pathlib
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import pymongo
+import pymongo.database
+
+from .. import ROOT
+from . import fake_elevenlabs, fake_wiki
+
+VOICE = {"id": "fakevoice", "nickname": "Harness", "use": True, "model": "fake_v1"}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def summary(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": statistics.fmean(values),
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1],
+    }
+
+
+def start_fake_elevenlabs(server: fake_elevenlabs.FakeElevenLabs, port: int) -> None:
+    ready = threading.Event()
+
+    async def serve() -> None:
+        started = asyncio.Event()
+        task = asyncio.create_task(server.serve("127.0.0.1", port, started))
+        await started.wait()
+        ready.set()
+        await task
+
+    threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+    ready.wait()
+
+
+def write_config(config_dir: pathlib.Path, keys: int) -> None:
+    config_dir.mkdir(parents=True)
+    with open(config_dir / "el_api_keys.json", "w") as f:
+        json.dump(
+            [
+                {"username": f"harness-{i}", "key": f"harness-key-{i}", "use": True}
+                for i in range(keys)
+            ],
+            f,
+            indent=4,
+        )
+    with open(config_dir / "voices.json", "w") as f:
+        json.dump([VOICE], f)
+    shutil.copy(ROOT / "config" / "global-replace.json", config_dir)
+
+
+async def wait_for_app(client: httpx.AsyncClient, app: subprocess.Popen) -> None:
+    while True:
+        if app.poll() is not None:
+            raise RuntimeError(f"Generator exited with {app.returncode}")
+        try:
+            await client.get("/api/queue/harness")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+
+
+async def request(
+    client: httpx.AsyncClient, article_id: str, slots: asyncio.Semaphore
+) -> tuple[int, float]:
+    async with slots:
+        start = time.monotonic()
+        r = await client.get(f"/api/manuscript/{article_id}")
+        return r.status_code, time.monotonic() - start
+
+
+async def drive(args: argparse.Namespace, db: pymongo.database.Database) -> dict:
+    articles = [f"Harness_article_{i:04}" for i in range(args.articles)]
+    collection = db["manuscripts"]
+    queue = db["queue"]
+
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{args.app_port}", timeout=120
+    ) as client:
+        await wait_for_app(client, args.app)
+        start = time.monotonic()
+        slots = asyncio.Semaphore(args.concurrency or len(articles))
+        responses = await asyncio.gather(*(request(client, a, slots) for a in articles))
+
+    samples = []
+    finished: dict[str, float] = {}
+    while len(finished) < len(articles):
+        elapsed = time.monotonic() - start
+        if elapsed > args.timeout:
+            break
+        for a in collection.find(
+            {"_id": {"$in": articles}},
+            {"state": 1, "complete_audio_url": 1},
+        ):
+            if a["_id"] not in finished and (
+                a.get("complete_audio_url") or a["state"] in ["error", "disallowed"]
+            ):
+                finished[a["_id"]] = elapsed
+        samples.append(
+            {
+                "t": round(elapsed, 1),
+                "queued": queue.count_documents({}),
+                "finished": len(finished),
+            }
+        )
+        await asyncio.sleep(args.poll)
+    elapsed = time.monotonic() - start
+
+    completed = collection.count_documents(
+        {"_id": {"$in": articles}, "complete_audio_url": {"$exists": True}}
+    )
+    stages = {
+        stage: summary(
+            [s["seconds"] for s in db["stats"].find({"stage": stage}, {"seconds": 1})]
+        )
+        for stage in ["parse", "tts", "assembly"]
+    }
+    depths = [s["queued"] for s in samples]
+    return {
+        "articles": len(articles),
+        "completed": completed,
+        "failed": len(finished) - completed,
+        "timed_out": len(articles) - len(finished),
+        "seconds": elapsed,
+        "articles_per_hour": completed / elapsed * 3600,
+        "status_codes": {
+            str(code): [c for c, _ in responses].count(code)
+            for code in sorted({c for c, _ in responses})
+        },
+        "request_latency": summary([t for _, t in responses]),
+        "article_latency": summary(list(finished.values())),
+        "stages": stages,
+        "queue": {
+            "max_depth": max(depths, default=0),
+            "mean_depth": statistics.fmean(depths) if depths else 0,
+            "samples": samples,
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['completed']}/{report['articles']} articles in "
+        f"{report['seconds']:.1f}s - {report['articles_per_hour']:.0f} articles/hour "
+        f"({report['failed']} failed, {report['timed_out']} timed out)"
+    )
+    print(f"responses: {report['status_codes']}")
+    rows = {
+        "request": report["request_latency"],
+        "article": report["article_latency"],
+        **{f"stage {k}": v for k, v in report["stages"].items()},
+    }
+    print(f"{'latency (s)':16} {'count':>6} {'p50':>8} {'p95':>8} {'max':>8}")
+    for name, s in rows.items():
+        if s["count"]:
+            print(
+                f"{name:16} {s['count']:6} {s['p50']:8.2f} {s['p95']:8.2f} "
+                f"{s['max']:8.2f}"
+            )
+    print(
+        f"queue depth: max {report['queue']['max_depth']}, "
+        f"mean {report['queue']['mean_depth']:.1f}"
+    )
+    print(f"elevenlabs: {json.dumps(report['elevenlabs'])}")
+    print(f"wiki: {json.dumps(report['wiki'])}")
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--articles", type=int, default=20)
+    parser.add_argument(
+        "--concurrency", type=int, default=0, help="concurrent requests (0: all)"
+    )
+    parser.add_argument("--mongodb", default="localhost")
+    parser.add_argument("--database", default="harness")
+    parser.add_argument("--keys", type=int, default=3, help="fake API keys")
+    parser.add_argument("--el-latency", type=float, default=0.5)
+    parser.add_argument("--el-latency-per-char", type=float, default=0.001)
+    parser.add_argument(
+        "--el-errors",
+        type=fake_elevenlabs.parse_errors,
+        default={},
+        help="e.g. system_busy=0.02,quota_exceeded=0.01",
+    )
+    parser.add_argument("--el-character-limit", type=int, default=10_000_000)
+    parser.add_argument("--wiki-latency", type=float, default=0.1)
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--poll", type=float, default=1)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the temporary directory"
+    )
+    args = parser.parse_args()
+
+    tmp = pathlib.Path(tempfile.mkdtemp(prefix="wos-harness-"))
+    write_config(tmp / "config", args.keys)
+
+    el_port, wiki_port, args.app_port = free_port(), free_port(), free_port()
+    el = fake_elevenlabs.FakeElevenLabs(
+        fake_elevenlabs.Config(
+            latency=args.el_latency,
+            latency_per_char=args.el_latency_per_char,
+            character_limit=args.el_character_limit,
+            errors=args.el_errors,
+        )
+    )
+    start_fake_elevenlabs(el, el_port)
+    wiki = fake_wiki.FakeWiki(("127.0.0.1", wiki_port), latency=args.wiki_latency)
+    threading.Thread(target=wiki.serve_forever, daemon=True).start()
+
+    mongo: pymongo.MongoClient = pymongo.MongoClient(args.mongodb, 27017)
+    mongo.drop_database(args.database)
+    db = mongo[args.database]
+
+    env = {
+        **os.environ,
+        "CONFIG_DIR": str(tmp / "config"),
+        "VOICES_JSON": str(tmp / "config" / "voices.json"),
+        "WEB_DIR": str(ROOT / "web"),
+        "DB_DIR": str(tmp / "db"),
+        "SAFE_QUOTA_MARGIN": "0",
+        "MONGODB_DOMAIN": args.mongodb,
+        "MONGODB_DATABASE": args.database,
+        "GENERATE_ARTICLES": "yes",
+        "PIPELINE_STATS": "yes",
+        "PD_URL": f"http://127.0.0.1:{wiki_port}",
+        "ELEVENLABS_API_URL": f"http://127.0.0.1:{el_port}",
+        "ELEVENLABS_WS_URL": f"ws://127.0.0.1:{el_port}",
+    }
+    (tmp / "db").mkdir()
+    with open(tmp / "generator.log", "w") as log:
+        args.app = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "src.main:APP",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(args.app_port),
+            ],
+            cwd=ROOT,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            report = asyncio.run(drive(args, db))
+        finally:
+            args.app.terminate()
+            args.app.wait(timeout=30)
+            wiki.shutdown()
+
+    report["elevenlabs"] = el.stats()
+    report["wiki"] = dict(wiki.counters)
+    report["config"] = {
+        k: v for k, v in vars(args).items() if k not in ["app", "save", "keep"]
+    }
+    print_report(report)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.keep:
+        print(f"generator log and audio kept in {tmp}")
+    else:
+        shutil.rmtree(tmp)
+    return 0 if report["completed"] == report["articles"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
@@ -0,0 +1,270 @@
+"""Local stand-in for the ElevenLabs API.
+
+Serves the multi-context stream-input websocket the generator uses, plus the
+subscription and voice endpoints, on one port. Audio is silent MPEG frames
+and alignment is evenly spaced, both sized to the text. Latency, per-key
+quota and error rates are configurable, so quota exhaustion, busy servers
+and disabled keys can be exercised without spending real characters.
+
+    python -m bench.harness.fake_elevenlabs --port 8101 --latency 0.5 \\
+        --errors system_busy=0.02,quota_exceeded=0.01
+
+Point the generator at it with ELEVENLABS_API_URL=http://127.0.0.1:8101 and
+ELEVENLABS_WS_URL=ws://127.0.0.1:8101.
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import dataclasses
+import http
+import json
+import math
+import random
+import time
+import typing
+
+import websockets.asyncio.server
+import websockets.exceptions
+import websockets.http11
+
+from src import mp3
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono, as requested by the generator
+HEADER = mp3.parse_header(b"\xff\xfb\x90\xc0", 0)
+assert HEADER
+FRAME = mp3.silent_frame(HEADER)
+FRAME_MS = HEADER.samples / HEADER.sample_rate * 1000
+
+ERRORS = ["quota_exceeded", "system_busy", "detected_unusual_activity"]
+
+
+def parse_errors(value: str) -> dict[str, float]:
+    errors = {}
+    for item in filter(None, value.split(",")):
+        name, rate = item.split("=")
+        if name not in ERRORS:
+            raise argparse.ArgumentTypeError(f'Unknown error "{name}"')
+        errors[name] = float(rate)
+    return errors
+
+
+@dataclasses.dataclass
+class Config:
+    latency: float = 0.5
+    latency_per_char: float = 0.001
+    jitter: float = 0.2
+    char_ms: int = 70
+    chunk_chars: int = 120
+    character_limit: int = 10_000_000
+    errors: dict[str, float] = dataclasses.field(default_factory=dict)
+
+
+class FakeElevenLabs:
+    def __init__(self, config: Config):
+        self.config = config
+        self.character_count: collections.Counter[str] = collections.Counter()
+        self.disabled: set[str] = set()
+        self.counters: collections.Counter[str] = collections.Counter()
+        self.active = 0
+        self.max_active = 0
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "max_concurrent_contexts": self.max_active,
+            "characters": dict(self.character_count),
+            "disabled_keys": sorted(self.disabled),
+        }
+
+    def json_response(
+        self,
+        connection: websockets.asyncio.server.ServerConnection,
+        status: http.HTTPStatus,
+        body: object,
+    ) -> websockets.http11.Response:
+        response = connection.respond(status, json.dumps(body))
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    def process_request(
+        self,
+        connection: websockets.asyncio.server.ServerConnection,
+        request: websockets.http11.Request,
+    ) -> websockets.http11.Response | None:
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            return None
+        self.counters["http_requests"] += 1
+        api_key = request.headers.get("xi-api-key", "")
+        path = request.path.split("?")[0]
+        if path == "/v1/user/subscription":
+            return self.json_response(
+                connection,
+                http.HTTPStatus.OK,
+                {
+                    "character_count": self.character_count[api_key],
+                    "character_limit": self.config.character_limit,
+                    "next_character_count_reset_unix": int(time.time()) + 3600,
+                },
+            )
+        if path.startswith("/v1/voices/"):
+            voice_id = path.rsplit("/", 1)[-1]
+            return self.json_response(
+                connection,
+                http.HTTPStatus.OK,
+                {"voice_id": voice_id, "name": f"Fake {voice_id}"},
+            )
+        if path == "/stats":
+            return self.json_response(connection, http.HTTPStatus.OK, self.stats())
+        return self.json_response(
+            connection,
+            http.HTTPStatus.NOT_FOUND,
+            {"detail": {"message": f"Unknown path {path}"}},
+        )
+
+    def injected_error(self, api_key: str, text: str) -> str | None:
+        if api_key in self.disabled:
+            return "detected_unusual_activity"
+        if self.character_count[api_key] + len(text) > self.config.character_limit:
+            return "quota_exceeded"
+        for name, rate in self.config.errors.items():
+            if random.random() < rate:
+                if name == "detected_unusual_activity":
+                    self.disabled.add(api_key)
+                return name
+        return None
+
+    def messages(self, context_id: str, text: str) -> typing.Iterator[dict]:
+        for i in range(0, len(text), self.config.chunk_chars):
+            chars = list(text[i : i + self.config.chunk_chars])
+            duration = len(chars) * self.config.char_ms
+            frames = math.ceil(duration / FRAME_MS)
+            yield {
+                "contextId": context_id,
+                "audio": base64.b64encode(FRAME * frames).decode(),
+                "alignment": {
+                    "chars": chars,
+                    "charStartTimesMs": [
+                        j * self.config.char_ms for j in range(len(chars))
+                    ],
+                    "charDurationsMs": [self.config.char_ms] * len(chars),
+                },
+            }
+
+    async def synthesize(
+        self,
+        websocket: websockets.asyncio.server.ServerConnection,
+        api_key: str,
+        context_id: str,
+        text: str,
+    ) -> bool:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(
+                max(
+                    0,
+                    self.config.latency
+                    + self.config.latency_per_char * len(text)
+                    + random.uniform(-self.config.jitter, self.config.jitter),
+                )
+            )
+            if error := self.injected_error(api_key, text):
+                self.counters[f"error_{error}"] += 1
+                await websocket.send(
+                    json.dumps(
+                        {
+                            "error": error,
+                            "message": f"Injected {error}",
+                            "contextId": context_id,
+                        }
+                    )
+                )
+                return False
+            self.character_count[api_key] += len(text)
+            self.counters["contexts"] += 1
+            self.counters["characters_total"] += len(text)
+            for message in self.messages(context_id, text):
+                await websocket.send(json.dumps(message))
+            return True
+        finally:
+            self.active -= 1
+
+    async def handler(
+        self, websocket: websockets.asyncio.server.ServerConnection
+    ) -> None:
+        assert websocket.request
+        api_key = websocket.request.headers.get("xi-api-key", "")
+        self.counters["connections"] += 1
+        contexts: dict[str, asyncio.Task] = {}
+
+        async def finish(context_id: str) -> None:
+            if await contexts.pop(context_id):
+                await websocket.send(
+                    json.dumps({"contextId": context_id, "isFinal": True})
+                )
+
+        try:
+            async for message in websocket:
+                r = json.loads(message)
+                context_id = r.get("context_id", "")
+                if r.get("close_socket"):
+                    break
+                if r.get("close_context"):
+                    if context_id in contexts:
+                        asyncio.create_task(finish(context_id))
+                elif "text" in r:
+                    contexts[context_id] = asyncio.create_task(
+                        self.synthesize(websocket, api_key, context_id, r["text"])
+                    )
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for task in contexts.values():
+                task.cancel()
+
+    async def serve(
+        self, host: str, port: int, ready: asyncio.Event | None = None
+    ) -> None:
+        async with websockets.asyncio.server.serve(
+            self.handler,
+            host,
+            port,
+            process_request=self.process_request,
+            max_size=None,
+        ):
+            if ready:
+                ready.set()
+            await asyncio.Future()
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--latency", type=float, default=Config.latency)
+    parser.add_argument(
+        "--latency-per-char", type=float, default=Config.latency_per_char
+    )
+    parser.add_argument("--jitter", type=float, default=Config.jitter)
+    parser.add_argument("--character-limit", type=int, default=Config.character_limit)
+    parser.add_argument("--errors", type=parse_errors, default={})
+    args = parser.parse_args()
+    server = FakeElevenLabs(
+        Config(
+            latency=args.latency,
+            latency_per_char=args.latency_per_char,
+            jitter=args.jitter,
+            character_limit=args.character_limit,
+            errors=args.errors,
+        )
+    )
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,138 @@
+"""Local stand-in for the Empire wiki and its MediaWiki API.
+
+Article pages are built from the HTML fixtures in bench/fixtures. Every
+article name maps to one fixture and gets its name written into the title
+and every heading, paragraph and list item. Different articles therefore
+have different text and are synthesised separately rather than served from
+the section store. The API answers the info and revisions queries the
+generator makes, with a fixed revision.
+
+    python -m bench.harness.fake_wiki --port 8102
+
+Point the generator at it with PD_URL=http://127.0.0.1:8102.
+"""
+
+import argparse
+import collections
+import hashlib
+import html
+import http
+import http.server
+import json
+import pathlib
+import threading
+import time
+import urllib.parse
+
+import regex
+
+from .. import FIXTURES_DIR
+
+WIKI_PATH = "/empire-wiki/"
+API_PATH = "/mediawiki-public/api.php"
+TIMESTAMP = "2024-01-01T00:00:00Z"
+TEXT_TAGS = regex.compile(r"(<(?:p|li|h2|h3)\b[^>]*>(?:<span[^>]*>)?)")
+TITLE = regex.compile(r'(<h1 id="firstHeading"[^>]*>)[^<]*(</h1>)')
+
+
+class FakeWiki(http.server.ThreadingHTTPServer):
+    def __init__(
+        self,
+        address: tuple[str, int],
+        fixtures_dir: pathlib.Path = FIXTURES_DIR,
+        latency: float = 0.1,
+        revision: int = 1,
+    ):
+        super().__init__(address, FakeWikiHandler)
+        self.fixtures = [p.read_text() for p in sorted(fixtures_dir.glob("*.html"))]
+        self.latency = latency
+        self.revision = revision
+        self.counters: collections.Counter[str] = collections.Counter()
+        self.lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] += 1
+
+    def article(self, article_id: str) -> str:
+        digest = hashlib.sha256(article_id.encode()).digest()
+        page = self.fixtures[digest[0] % len(self.fixtures)]
+        name = html.escape(article_id.replace("_", " "))
+        page = TITLE.sub(lambda m: f"{m[1]}{name}{m[2]}", page, count=1)
+        return str(TEXT_TAGS.sub(lambda m: f"{m[1]}{name} ", page))
+
+    def api(self, query: dict[str, list[str]]) -> dict:
+        title = query.get("titles", [""])[0]
+        revision = {"revid": self.revision, "timestamp": TIMESTAMP}
+        page: dict = {
+            "pageid": int.from_bytes(hashlib.sha256(title.encode()).digest()[:4]),
+            "ns": 0,
+            "title": title.replace("_", " "),
+        }
+        props = query.get("prop", [""])[0].split("|")
+        if "info" in props:
+            page["lastrevid"] = self.revision
+        if "revisions" in props:
+            page["revisions"] = [revision]
+        return {"batchcomplete": "", "query": {"pages": {str(page["pageid"]): page}}}
+
+
+class FakeWikiHandler(http.server.BaseHTTPRequestHandler):
+    server: FakeWiki
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def send(self, status: http.HTTPStatus, body: str, content_type: str) -> None:
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == API_PATH:
+            self.server.count("api_requests")
+            query = urllib.parse.parse_qs(url.query)
+            self.send(
+                http.HTTPStatus.OK,
+                json.dumps(self.server.api(query)),
+                "application/json",
+            )
+        elif url.path.startswith(WIKI_PATH):
+            self.server.count("page_requests")
+            article_id = urllib.parse.unquote(url.path[len(WIKI_PATH) :])
+            self.send(
+                http.HTTPStatus.OK,
+                self.server.article(article_id),
+                "text/html; charset=UTF-8",
+            )
+        elif url.path == "/stats":
+            self.send(
+                http.HTTPStatus.OK,
+                json.dumps(self.server.counters),
+                "application/json",
+            )
+        else:
+            self.send(http.HTTPStatus.NOT_FOUND, "Not found", "text/plain")
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8102)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--revision", type=int, default=1)
+    args = parser.parse_args()
+    FakeWiki(
+        (args.host, args.port), latency=args.latency, revision=args.revision
+    ).serve_forever()
+
+
+if __name__ == "__main__":
+    run()
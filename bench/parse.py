@@ -0,0 +1,57 @@
+"""Check that article parsing gives the same result with the fast parser as
+with the original html.parser path, and time both.
+
+Run from the repository root:
+
+    python -m bench.parse [fixtures...]
+"""
+
+import argparse
+import json
+import pathlib
+import time
+
+from src import main
+
+from . import FIXTURES_DIR
+
+
+def timed(html: str, repeat: int, **kwargs: object) -> tuple[str, float]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = main.parse_article(html, **kwargs)  # type: ignore[arg-type]
+    return json.dumps(result), (time.perf_counter() - start) / repeat
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("fixtures", nargs="*", type=pathlib.Path)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fixtures = args.fixtures or sorted(FIXTURES_DIR.glob("*.html"))
+    failures = 0
+    total_old = total_new = 0.0
+    for path in fixtures:
+        html = path.read_text()
+        old, t_old = timed(html, args.repeat, features="html.parser", parse_only=None)
+        new, t_new = timed(html, args.repeat)
+        total_old += t_old
+        total_new += t_new
+        same = old == new
+        failures += not same
+        print(
+            f"{path.name:40} {'same' if same else 'DIFFERENT':9} "
+            f"html.parser {t_old * 1000:8.2f} ms  lxml {t_new * 1000:8.2f} ms  "
+            f"x{t_old / t_new:.1f}"
+        )
+    print(
+        f"{'total':40} {len(fixtures) - failures}/{len(fixtures)} same "
+        f"html.parser {total_old * 1000:8.2f} ms  lxml {total_new * 1000:8.2f} ms  "
+        f"x{total_old / total_new:.1f}"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(run())
@@ -0,0 +1,157 @@
+import dataclasses
+import typing
+
+import numpy as np
+import regex
+
+
+@dataclasses.dataclass
+class Rule:
+    """Replace the words matching `search`, preceded by `offset` other words,
+    with one word reading `replacement` (prefixed by the offset words)."""
+
+    search: list[str]
+    replacement: str
+    offset: int = 0
+    is_regex: bool = False
+
+    def __post_init__(self) -> None:
+        self.matchers: list[typing.Callable[[str], typing.Any]] = [
+            (
+                regex.compile(s, regex.IGNORECASE).match
+                if self.is_regex
+                else s.lower().__eq__
+            )
+            for s in self.search
+        ]
+
+    def matches(self, words: list[str], lower: list[str], i: int) -> bool:
+        j = i + self.offset
+        if not self.search or j + len(self.search) > len(words):
+            return False
+        return all(
+            m(words[j + k] if self.is_regex else lower[j + k])
+            for k, m in enumerate(self.matchers)
+        )
+
+
+class Alignment:
+    """Word timings of a piece of synthesised audio, in milliseconds.
+
+    Words are kept as a list of strings next to typed arrays of start times
+    and lengths, and serialise to the `[{"text", "start", "length"}]` JSON
+    the frontend reads.
+    """
+
+    def __init__(self, words: list[str], starts: np.ndarray, lengths: np.ndarray):
+        self.words = words
+        self.starts = starts
+        self.lengths = lengths
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @classmethod
+    def from_json(cls, alignment: list[dict]) -> "Alignment":
+        return cls(
+            [a["text"] for a in alignment],
+            np.array([a["start"] for a in alignment], dtype=np.int64),
+            np.array([a["length"] for a in alignment], dtype=np.int64),
+        )
+
+    @classmethod
+    def from_chunks(cls, chunks: list[dict], min_length: int) -> "Alignment":
+        """Group ElevenLabs character timings into words.
+
+        A word takes its first character unconditionally and is ended by the
+        next whitespace, so in a run of whitespace every other character
+        ends a word and the ones in between start the next. A word lasts
+        until the end of the whitespace that ends it. Chunk times are
+        relative to the chunk and are shifted by the end of the previous
+        chunk."""
+        words: list[str] = []
+        starts: list[np.ndarray] = []
+        lengths: list[np.ndarray] = []
+        offset = 0
+        for chunk in chunks:
+            chars = chunk["chars"]
+            if not chars:
+                continue
+            n = len(chars)
+            text = "".join(chars)
+            char_starts = np.asarray(chunk["charStartTimesMs"], dtype=np.int64)
+            durations = np.asarray(chunk["charDurationsMs"], dtype=np.int64)
+
+            index = np.arange(n)
+            space = np.fromiter((c.isspace() for c in chars), bool, n)
+            run_start = np.maximum.accumulate(
+                np.where(space & ~np.concatenate(([False], space[:-1])), index, 0)
+            )
+            # a run of whitespace at the very start begins with a word
+            parity = index - run_start - (run_start == 0) * space[0]
+            ends = np.flatnonzero(space & (parity % 2 == 0))
+            first = np.concatenate(([0], ends[ends + 1 < n] + 1))
+            last = ends if len(ends) == len(first) else np.append(ends, n)
+            elapsed = np.cumsum(durations)
+            end = np.minimum(last, n - 1)
+            total = elapsed[end] - np.concatenate(([0], elapsed[end[:-1]]))
+
+            words.extend(text[f:l] for f, l in zip(first, last))
+            starts.append(char_starts[first] + offset)
+            lengths.append(np.maximum(total, min_length))
+            offset += int(char_starts[-1] + durations[-1])
+
+        return cls(
+            words,
+            np.concatenate(starts) if starts else np.zeros(0, np.int64),
+            np.concatenate(lengths) if lengths else np.zeros(0, np.int64),
+        )
+
+    def to_json(self) -> list[dict]:
+        return [
+            {"text": t, "start": s, "length": l}
+            for t, s, l in zip(self.words, self.starts.tolist(), self.lengths.tolist())
+        ]
+
+    def merge(self, rules: list[Rule], min_length: int) -> "Alignment":
+        """Apply `rules` in a single left-to-right pass. At each word the first
+        matching rule wins; merged words start where the first one starts and
+        last for the sum of their lengths."""
+        lower = [w.lower() for w in self.words]
+        # literal rules without an offset can only match where their first
+        # word is, so only those need to be tried at each position
+        indexed: dict[str, list[tuple[int, Rule]]] = {}
+        general: list[tuple[int, Rule]] = []
+        for k, rule in enumerate(rules):
+            if rule.is_regex or rule.offset or not rule.search:
+                general.append((k, rule))
+            else:
+                indexed.setdefault(rule.search[0].lower(), []).append((k, rule))
+
+        elapsed = np.concatenate(([0], np.cumsum(self.lengths)))
+        keep: list[int] = []
+        words: list[str] = []
+        lengths: list[int] = []
+        i = 0
+        while i < len(self.words):
+            candidates = indexed.get(lower[i], [])
+            if general:
+                candidates = sorted(general + candidates, key=lambda c: c[0])
+            for _, rule in candidates:
+                if rule.matches(self.words, lower, i):
+                    n = rule.offset + len(rule.search)
+                    prefix = " ".join(self.words[i : i + rule.offset])
+                    keep.append(i)
+                    words.append(
+                        f"{prefix} {rule.replacement}" if prefix else rule.replacement
+                    )
+                    lengths.append(max(int(elapsed[i + n] - elapsed[i]), min_length))
+                    i += n
+                    break
+            else:
+                keep.append(i)
+                words.append(self.words[i])
+                lengths.append(int(self.lengths[i]))
+                i += 1
+
+        return Alignment(words, self.starts[keep], np.array(lengths, dtype=np.int64))
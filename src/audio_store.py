@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import time
+import typing
+
+
+def section_key(
+    text: str, voice_id: str, model: str, transform: str | None = None
+) -> str:
+    parts = [" ".join(text.split()), voice_id, model]
+    if transform:
+        parts.append(transform)
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def variant_key(parts: list[str]) -> str:
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()[:16]
+
+
+def write_atomic(path: pathlib.Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class SectionAudioStore:
+    """Content-addressed store of synthesised section audio and alignment.
+
+    Blobs are keyed by `section_key`, so the same text read by the same voice
+    and model is only ever synthesised once, whichever article it belongs to.
+    A key may have alignment variants (e.g. list items merged back into their
+    spans) stored next to the base alignment.
+    """
+
+    def __init__(self, root: pathlib.Path):
+        self.root = root
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def _dir(self, key: str) -> pathlib.Path:
+        return self.root / key[:2]
+
+    def audio_path(self, key: str) -> pathlib.Path:
+        return self._dir(key) / f"{key}.mp3"
+
+    def alignment_path(self, key: str, variant: str | None = None) -> pathlib.Path:
+        return self._dir(key) / (f"{key}.{variant}.json" if variant else f"{key}.json")
+
+    def has(self, key: str) -> bool:
+        return self.audio_path(key).exists() and self.alignment_path(key).exists()
+
+    def touch(self, key: str) -> bool:
+        """Mark the blobs of `key` as just used, so garbage collection gives
+        them another grace period before the manuscript referring to them is
+        stored. Returns False when they are not (or no longer) stored."""
+        try:
+            os.utime(self.audio_path(key))
+            os.utime(self.alignment_path(key))
+        except FileNotFoundError:
+            return False
+        for path in self._dir(key).glob(f"{key}.*.json"):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def load_alignment(self, key: str, variant: str | None = None) -> list[dict]:
+        with open(self.alignment_path(key, variant)) as f:
+            return list(json.load(f))
+
+    def put(self, key: str, audio: bytes, alignment: list[dict]) -> None:
+        self._dir(key).mkdir(parents=True, exist_ok=True)
+        write_atomic(self.audio_path(key), audio)
+        self.put_alignment(key, alignment)
+
+    def put_alignment(
+        self, key: str, alignment: list[dict], variant: str | None = None
+    ) -> None:
+        self._dir(key).mkdir(parents=True, exist_ok=True)
+        write_atomic(self.alignment_path(key, variant), json.dumps(alignment).encode())
+
+    async def ensure(
+        self,
+        key: str,
+        create: typing.Callable[[], typing.Awaitable[tuple[bytes, list[dict]]]],
+    ) -> bool:
+        """Make sure `key` is stored, calling `create` at most once per key even
+        when several sections ask for it concurrently. Returns whether the blob
+        was already stored."""
+        if self.touch(key):
+            return True
+        if key not in self._inflight:
+
+            async def _create() -> None:
+                try:
+                    audio, alignment = await create()
+                    await asyncio.to_thread(self.put, key, audio, alignment)
+                finally:
+                    del self._inflight[key]
+
+            self._inflight[key] = asyncio.create_task(_create())
+        await asyncio.shield(self._inflight[key])
+        return False
+
+    def collect_garbage(self, referenced: set[str], grace: float) -> int:
+        removed = 0
+        cutoff = time.time() - grace
+        for path in self.root.glob("*/*"):
+            if path.name.split(".")[0] in referenced:
+                continue
+            if path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
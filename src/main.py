@@ -1,35 +1,53 @@
 import asyncio
 import base64
+import concurrent.futures
+import contextlib
 import datetime
+import gzip
+import hashlib
 import http
+import io
 import json
 import logging
+import math
 import multiprocessing
 import os
 import pathlib
+import queue
 import random
+import shutil
+import tempfile
+import threading
 import time
 import typing
 import urllib
+import uuid
 
 import bs4
 import dateutil.parser
 import dotenv
 import fastapi
 import fastapi.responses
-import fastapi.staticfiles
 import httpx
+import mutagen.id3
 import pydantic
 import pydub
 import pymongo
 import regex
 import starlette.responses
-import tqdm
 import websockets
+import websockets.asyncio.client
 from loguru import logger
 from pydantic.dataclasses import dataclass
 
-from .utils import url_to_path
+from . import alignment, audio_store, mp3, page, pronunciation, scheduler, static
+from .utils import (
+    MANUSCRIPT_INDEXES,
+    cache_headers,
+    episode_summaries,
+    not_modified,
+    url_to_path,
+)
 
 CONFIG_DIR = pathlib.Path(os.environ["CONFIG_DIR"])
 WEB_DIR = pathlib.Path(os.environ["WEB_DIR"])
@@ -41,38 +59,47 @@ ELEVENLABS_API_KEYS_JSON = CONFIG_DIR / "el_api_keys.json"
 ELEVENLABS_FRAME_RATE = 44_100
 ELEVENLABS_BITRATE = 128_000
 ELEVENLABS_CHANNELS = 1
+ELEVENLABS_RECONNECTS = 3
+# Longest wait for the final message of one section
+ELEVENLABS_CONTEXT_TIMEOUT = float(os.environ.get("ELEVENLABS_CONTEXT_TIMEOUT", 180))
+ELEVENLABS_API_URL = os.environ.get("ELEVENLABS_API_URL", "https://api.elevenlabs.io")
+ELEVENLABS_WS_URL = os.environ.get("ELEVENLABS_WS_URL", "wss://api.elevenlabs.io")
 SAFE_QUOTA_MARGIN = int(os.environ["SAFE_QUOTA_MARGIN"])
+TTS_CONCURRENCY_PER_KEY = int(os.environ.get("TTS_CONCURRENCY_PER_KEY", 3))
+QUOTA_REFRESH_INTERVAL = int(os.environ.get("QUOTA_REFRESH_INTERVAL", 10 * 60))
+AUDIO_TARGET_DBFS = (
+    float(os.environ["AUDIO_TARGET_DBFS"])
+    if "AUDIO_TARGET_DBFS" in os.environ
+    else None
+)
 VOICES_JSON = os.environ["VOICES_JSON"]
+GLOBAL_REPLACE_JSON = os.environ.get(
+    "GLOBAL_REPLACE_JSON", CONFIG_DIR / "global-replace.json"
+)
 
 with open(VOICES_JSON) as f:
     VOICES = json.load(f)
 
-GLOBAL_REPLACE = [
-    ("sumaah", "Suhmah"),
-    ("jotun", "Jotoon"),
-    ("vallorn", "Valorn"),
-    # ("druj", "Drooge"),
-    ("feni", "Fenni"),
-    ("in-character", "incharacter"),
-    ("temeschwar", "Temmeschwar"),
-    ("sermersuaq", "semmersuak"),
-    ("thule", "thool"),
-    ("egregore", "egrigore"),
-    ("(?<=\\d{3})YE", " Year of the Empire"),
-    # ("(?<=\\s|\\n)OOC(?=,|;|\\.|:|\\?|!|'|\"|\\)|$|\\n|\\s)", "out of character"),
-    ("yegarra", "yehgarra"),
-    ("profounddecisions.co.uk", ""),
-    ("mareave", "mareeve"),
-]
+PRONUNCIATION = pronunciation.Pronunciation.from_json(GLOBAL_REPLACE_JSON)
+
 POST_REPLACE = [
-    (["Year", "of", "the", "Empire[,;.:?!'\")]*"], "YE", 1),
-    # (["out", "of", "character[,;.:?!'\")]*"], "OOC", 0),
+    alignment.Rule(["Year", "of", "the", "Empire[,;.:?!'\")]*"], "YE", 1, True),
+    alignment.Rule(["out", "of", "character[,;.:?!'\")]*"], "OOC", 0, True),
 ]
 
 MONGODB_DOMAIN = os.environ.get("MONGODB_DOMAIN", default="localhost")
+MONGODB_DATABASE = os.environ.get("MONGODB_DATABASE", "database")
 AUDIO_DIR_NAME = "audio"
-PD_URL = "https://www.profounddecisions.co.uk"
+PD_URL = os.environ.get("PD_URL", "https://www.profounddecisions.co.uk")
 WIKI_URL = f"{PD_URL}/empire-wiki"
+SITE_URL = "https://www.pprofounddecisions.co.uk"
+# ID3 tags of the complete audio, as shown by podcast players
+AUDIO_TAG_ALBUM = os.environ.get("AUDIO_TAG_ALBUM", "Empire Winds of Speech")
+AUDIO_TAG_ARTIST = os.environ.get(
+    "AUDIO_TAG_ARTIST", "Profound Decisions,Jens (Bloodcrow Knott)"
+)
+CHAPTER_SEGMENT_TYPE = os.environ.get("CHAPTER_SEGMENT_TYPE", "h2")
+SITEMAP_MAX_URLS = 50_000
 API_URL = f"{PD_URL}/mediawiki-public/api.php"
 
 SECTION_TYPE_SKIP = ["img"]
@@ -80,6 +107,8 @@ MIN_TIME = 1
 HOME_ID = ""
 DISALLOWED_ID = "text-to-speech:disallowed"
 ERROR_ID = "text-to-speech:error"
+# Error and disallowed articles are read with the audio of these documents
+PLACEHOLDER_STATES = {ERROR_ID: "error", DISALLOWED_ID: "disallowed"}
 
 HTTP_LOOKUP = {
     "done": http.HTTPStatus.OK,
@@ -133,11 +162,69 @@ OUTRO_POST_SILENCE = 4
 
 CHAPTER_TYPE = "h2"
 
-APP = fastapi.FastAPI()
+PARSER_WORKERS = int(os.environ.get("PARSER_WORKERS", 2))
+TTS_ARTICLES = int(os.environ.get("TTS_ARTICLES", 2))
+ASSEMBLY_WORKERS = int(os.environ.get("ASSEMBLY_WORKERS", 2))
+STAGE_QUEUE_SIZE = int(os.environ.get("STAGE_QUEUE_SIZE", 4))
+
+PIPELINE_STATS = bool(os.getenv("PIPELINE_STATS", False))
+
+INDEX_CACHE_SIZE = int(os.environ.get("INDEX_CACHE_SIZE", 1024))
+INDEX_TEMPLATE = page.Template(WEB_DIR / "index.html")
+INDEX_CACHE = page.PageCache(INDEX_CACHE_SIZE)
+
+STORE_GC_INTERVAL = int(os.environ.get("STORE_GC_INTERVAL", 24 * 60 * 60))
+STORE_GC_GRACE = int(os.environ.get("STORE_GC_GRACE", 24 * 60 * 60))
+ARTIFACT_HASH_LENGTH = 16
+
+# Articles between the parse stage and the end of assembly, with the scraping
+# url of a request for the article that came in meanwhile
+IN_PIPELINE: dict[str, str | None] = {}
+IN_PIPELINE_LOCK = threading.Lock()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI) -> typing.AsyncIterator[None]:
+    await ASYNC_COLLECTION.create_indexes(MANUSCRIPT_INDEXES)
+    logger.info(
+        f"Precompressed {await asyncio.to_thread(static.precompress, WEB_DIR)} web assets"
+    )
+    processor = multiprocessing.Process(target=article_processor, args=(article_queue,))
+    processor.start()
+    yield
+    processor.terminate()
+    await ASYNC_DB_CLIENT.close()
+
+
+APP = fastapi.FastAPI(lifespan=lifespan)
 DB_CLIENT: pymongo.MongoClient = pymongo.MongoClient(MONGODB_DOMAIN, 27017)
-DB = DB_CLIENT["database"]
+DB = DB_CLIENT[MONGODB_DATABASE]
 COLLECTION = DB["manuscripts"]
 META = DB["meta"]
+QUEUE = DB["queue"]
+STATS = DB["stats"]
+# Request handlers use the async driver so a slow query does not hold a
+# worker thread; the processing pipeline keeps the synchronous client.
+ASYNC_DB_CLIENT: pymongo.AsyncMongoClient = pymongo.AsyncMongoClient(
+    MONGODB_DOMAIN, 27017
+)
+ASYNC_DB = ASYNC_DB_CLIENT[MONGODB_DATABASE]
+ASYNC_COLLECTION = ASYNC_DB["manuscripts"]
+ASYNC_META = ASYNC_DB["meta"]
+
+# Projections for reading manuscripts, the transcript and the spans make up
+# most of a document. The episode metadata is only read by the podcast feed.
+WITHOUT_TRANSCRIPT = {"transcript": 0, "episode": 0}
+# Enough to answer a conditional GET and queue a refresh
+VALIDATOR_FIELDS = {"state": 1, "lastmod": 1, "modified": 1, "cost": 1}
+RENDER_FIELDS = {
+    "state": 1,
+    "title": 1,
+    "img": 1,
+    "sections.section_type": 1,
+    "sections.spans.text": 1,
+}
+STORE = audio_store.SectionAudioStore(DB_DIR / "store")
 
 
 # @dataclass
@@ -177,10 +264,6 @@ class ElevenLabsQuotaExceededError(ElevenLabsError):
     pass
 
 
-class ElevenLabsSafeQuotaStop(ElevenLabsError):
-    pass
-
-
 class ElevenLabsSystemBusyError(ElevenLabsError):
     pass
 
@@ -207,11 +290,24 @@ class ElevenLabsInvalidStatus(ElevenLabsError):
     pass
 
 
+class ElevenLabsNoUsableKey(ElevenLabsError):
+    pass
+
+
 ARTICLE_REPR_KEYS = ["title", "url", "sections"]
+SECTION_REPR_KEYS = ["section_type", "spans", "src", "alt"]
 
 
 def article_repr(article: dict) -> dict:
-    return {k: v for k, v in article.items() if k in ARTICLE_REPR_KEYS}
+    return {
+        k: (
+            [{kk: vv for kk, vv in s.items() if kk in SECTION_REPR_KEYS} for s in v]
+            if k == "sections"
+            else v
+        )
+        for k, v in article.items()
+        if k in ARTICLE_REPR_KEYS
+    }
 
 
 def manuscript_changed(article0: dict, article1: dict) -> bool:
@@ -230,253 +326,361 @@ def my_url(url: str) -> str:
     return url
 
 
-async def elevenlabs_tts_alignment(
-    text: str, voice: ELVoice, elevenlabs_api_key: str
-) -> tuple[pydub.AudioSegment, list[dict]]:
-    try:
-        while True:
-            try:
-                user_subscription_r = httpx.get(
-                    "https://api.elevenlabs.io/v1/user/subscription",
-                    headers={"xi-api-key": elevenlabs_api_key},
-                    timeout=60,
-                )
-                break
-            except Exception as e:
-                logger.error(f"Could not get EL subscription, retrying in 10 min: {e}")
-                await asyncio.sleep(10 * 60)
-        if user_subscription_r.is_success:
-            user_subscription = user_subscription_r.json()
-            if (
-                user_subscription["character_count"]
-                > user_subscription["character_limit"] - SAFE_QUOTA_MARGIN
-            ):
-                raise ElevenLabsSafeQuotaStop(
-                    f'Character count ({user_subscription["character_count"]}) too close to character limit ({user_subscription["character_limit"]}, making safe quota stop ({user_subscription["character_limit"]-user_subscription["character_count"]}/{SAFE_QUOTA_MARGIN})'
-                )
-        else:
-            logger.error(user_subscription_r.json()["detail"]["message"])
-
-        url = f"wss://api.elevenlabs.io/v1/text-to-speech/{voice.id}/stream-input?output_format=mp3_{ELEVENLABS_FRAME_RATE}_{ELEVENLABS_BITRATE//1000}&model_id={voice.model}"
-        async with websockets.connect(url) as websocket:
-            body = {
-                "text": text,
-                "try_trigger_generation": True,
-                "xi-api-key": elevenlabs_api_key,
-            }
-            # if voice.settings:
-            #     body["settings"] = dataclasses.asdict(voice.settings)
-            # if voice.generation_config:
-            #     body["generation_config"] = dataclasses.asdict(voice.generation_config)
-
-            await websocket.send(json.dumps(body))
-            await websocket.send(json.dumps({"text": ""}))
-
-            audio = b""
-            alignment: list[dict] = []
-            start = 0
-            word: list[tuple[str, int]] = []
-            length = 0
-            while True:
-                r = json.loads(await websocket.recv())
+def elevenlabs_error(r: dict, voice: ELVoice) -> ElevenLabsError:
+    if r["error"] == "quota_exceeded":
+        return ElevenLabsQuotaExceededError(r["message"])
+    elif r["error"] == "system_busy":
+        return ElevenLabsSystemBusyError(r["message"])
+    elif r["error"] == "input_timeout_exceeded":
+        return ElevenLabsInputTimeoutExceededError(r["message"])
+    elif r["error"] == "something_went_wrong":
+        return ElevenLabsSomethingWentWrong(r["message"])
+    elif r["error"] == "voice_id_does_not_exist":
+        return ElevenLabsVoiceIdDoesNotExist(r["message"], voice)
+    elif r["error"] == "detected_unusual_activity":
+        return ElevenLabsDetectedUnusualActivity(r["message"])
+    else:
+        return ElevenLabsError(r)
+
+
+class ElevenLabsContext:
+    def __init__(self) -> None:
+        self.audio = b""
+        self.alignments: list[dict] = []
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class ElevenLabsStream:
+    def __init__(
+        self, websocket: websockets.asyncio.client.ClientConnection, voice: ELVoice
+    ):
+        self.websocket = websocket
+        self.voice = voice
+        self.contexts: dict[str, ElevenLabsContext] = {}
+        self.reader = asyncio.create_task(self.read())
+
+    def fail(self, e: BaseException) -> None:
+        for context in self.contexts.values():
+            if not context.done.done():
+                context.done.set_exception(e)
+        self.contexts.clear()
+
+    async def read(self) -> None:
+        try:
+            async for message in self.websocket:
+                r = json.loads(message)
+                context = self.contexts.get(r.get("contextId", r.get("context_id")))
                 if "error" in r:
-                    if r["error"] == "quota_exceeded":
-                        raise ElevenLabsQuotaExceededError(r["message"])
-                    elif r["error"] == "system_busy":
-                        raise ElevenLabsSystemBusyError(r["message"])
-                    elif r["error"] == "input_timeout_exceeded":
-                        raise ElevenLabsInputTimeoutExceededError(r["message"])
-                    elif r["error"] == "something_went_wrong":
-                        raise ElevenLabsSomethingWentWrong(r["message"])
-                    elif r["error"] == "voice_id_does_not_exist":
-                        raise ElevenLabsVoiceIdDoesNotExist(r["message"], voice)
-                    elif r["error"] == "detected_unusual_activity":
-                        raise ElevenLabsDetectedUnusualActivity(r["message"])
+                    e = elevenlabs_error(r, self.voice)
+                    if context and not context.done.done():
+                        context.done.set_exception(e)
                     else:
-                        raise ElevenLabsError(r)
-
-                if r["audio"]:
-                    audio += base64.b64decode(r["audio"].encode())
-                if r["alignment"]:
-                    for i, (c, a, l) in enumerate(
-                        zip(
-                            r["alignment"]["chars"],
-                            r["alignment"]["charStartTimesMs"],
-                            r["alignment"]["charDurationsMs"],
-                        )
-                    ):
-                        length += l
-                        if word and c.isspace():
-                            alignment.append(
-                                {
-                                    "text": "".join(w[0] for w in word),
-                                    "start": word[0][1],
-                                    "length": max(length, MIN_TIME * 1000),
-                                }
-                            )
-                            word = []
-                            length = 0
-                        else:
-                            word.append((c, a + start))
-
-                    if word:
-                        alignment.append(
-                            {
-                                "text": "".join(w[0] for w in word),
-                                "start": word[0][1],
-                                "length": max(length, MIN_TIME * 1000),
-                            }
-                        )
-                    word = []
-                    length = 0
-                    start += a + l
-                if r["isFinal"]:
-                    break
-    except websockets.exceptions.InvalidStatus as e:
-        raise ElevenLabsInvalidStatus(e)
-    with open("tmp.mp3", "wb") as f:
-        f.write(audio)
-    a = pydub.AudioSegment.from_file("tmp.mp3", format="mp3")
-    # a = pydub.AudioSegment.from_mp3(io.BytesIO(audio))  # , bitrate="128k")
-    # a = a.set_frame_rate(ELEVENLABS_FRAME_RATE)
-    # a = a.set_channels(ELEVENLABS_CHANNELS)
-    return (
-        a,
-        # pydub.effects.normalize(a),
-        alignment,
+                        self.fail(e)
+                    continue
+                if not context:
+                    continue
+                if r.get("audio"):
+                    context.audio += base64.b64decode(r["audio"].encode())
+                if r.get("alignment"):
+                    context.alignments.append(r["alignment"])
+                if r.get("isFinal") and not context.done.done():
+                    context.done.set_result(None)
+        except websockets.exceptions.ConnectionClosedError as e:
+            self.fail(e)
+        else:
+            self.fail(websockets.exceptions.ConnectionClosedError(None, None, None))
+
+    async def synthesize(self, text: str) -> tuple[bytes, list[dict]]:
+        context_id = uuid.uuid4().hex
+        context = self.contexts[context_id] = ElevenLabsContext()
+        try:
+            await self.websocket.send(
+                json.dumps(
+                    {"text": f"{text} ", "context_id": context_id, "flush": True}
+                )
+            )
+            await self.websocket.send(
+                json.dumps({"context_id": context_id, "close_context": True})
+            )
+            try:
+                await asyncio.wait_for(context.done, ELEVENLABS_CONTEXT_TIMEOUT)
+            except TimeoutError:
+                # Retried like a dropped connection
+                logger.warning(
+                    f"No final message for context {context_id} after {ELEVENLABS_CONTEXT_TIMEOUT}s"
+                )
+                raise websockets.exceptions.ConnectionClosedError(None, None, None)
+        finally:
+            self.contexts.pop(context_id, None)
+        return context.audio, context.alignments
+
+    async def close(self) -> None:
+        try:
+            await self.websocket.send(json.dumps({"close_socket": True}))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        await self.websocket.close()
+        self.reader.cancel()
+
+
+class ElevenLabsSession:
+    """Keeps one multi-context stream-input connection per API key open for a
+    voice, so every section of an article is sent over the same websocket
+    instead of paying a connection (and TLS) setup per section."""
+
+    def __init__(self, voice: ELVoice):
+        self.voice = voice
+        self.streams: dict[str, ElevenLabsStream] = {}
+        self.lock = asyncio.Lock()
+
+    async def stream(self, api_key: str) -> ElevenLabsStream:
+        async with self.lock:
+            stream = self.streams.get(api_key)
+            if stream is None or stream.reader.done():
+                url = f"{ELEVENLABS_WS_URL}/v1/text-to-speech/{self.voice.id}/multi-stream-input?output_format=mp3_{ELEVENLABS_FRAME_RATE}_{ELEVENLABS_BITRATE//1000}&model_id={self.voice.model}&inactivity_timeout=180"
+                try:
+                    websocket = await websockets.connect(
+                        url, additional_headers={"xi-api-key": api_key}
+                    )
+                except websockets.exceptions.InvalidStatus as e:
+                    raise ElevenLabsInvalidStatus(e)
+                stream = self.streams[api_key] = ElevenLabsStream(websocket, self.voice)
+            return stream
+
+    async def synthesize(self, text: str, api_key: str) -> tuple[bytes, list[dict]]:
+        for attempt in range(ELEVENLABS_RECONNECTS):
+            stream = await self.stream(api_key)
+            try:
+                return await stream.synthesize(text)
+            except websockets.exceptions.ConnectionClosedError as e:
+                if attempt == ELEVENLABS_RECONNECTS - 1:
+                    raise
+                logger.info(f"Websocket connection closed, reconnecting: {e}")
+        raise AssertionError("unreachable")
+
+    async def close(self) -> None:
+        for stream in self.streams.values():
+            await stream.close()
+        self.streams.clear()
+
+
+async def elevenlabs_tts_alignment(
+    text: str, session: ElevenLabsSession, elevenlabs_api_key: str
+) -> tuple[bytes, alignment.Alignment]:
+    audio, chunks = await session.synthesize(text, elevenlabs_api_key)
+    return audio, alignment.Alignment.from_chunks(chunks, MIN_TIME * 1000)
+
+
+def transform_audio(audio: bytes, target_dBFS: float) -> bytes:
+    sound = pydub.AudioSegment.from_file(io.BytesIO(audio), format="mp3")
+    sound = match_target_amplitude(sound, target_dBFS)
+    buffer = sound.export(
+        io.BytesIO(), bitrate=f"{ELEVENLABS_BITRATE//1000}k", format="mp3"
     )
-    # return (
-    #     match_target_amplitude(
-    #         pydub.effects.normalize(pydub.AudioSegment.from_mp3(io.BytesIO(audio))),
-    #         -20.0,
-    #     ),
-    #     alignment,
-    # )
-
-
-def replace_sublist(
-    seq: list[dict],
-    search: list[str],
-    replacement: str,
-    offset: int,
-    is_regex: bool = False,
-) -> list[dict]:
-    result = []
-    i = 0
-    while i < len(seq):
-        # if sequence "text" matches search sublist replace with replacement "text"
-        # but with first search elements "start" time
-        if i <= (len(seq) - offset - len(search)) and all(
-            [
-                (
-                    regex.compile(s, regex.IGNORECASE).match(d["text"])
-                    if is_regex
-                    else s.lower() == d["text"].lower()
+    return bytes(buffer.read())
+
+
+def audio_transform_key() -> str | None:
+    if AUDIO_TARGET_DBFS is None:
+        return None
+    return f"dbfs={AUDIO_TARGET_DBFS}"
+
+
+class KeyQuota:
+    def __init__(self, api_key: APIKey):
+        self.api_key = api_key
+        self.character_count = 0
+        self.character_limit: int | None = None
+        self.next_reset: float | None = None
+        self.refreshed = 0.0
+        self.in_use = 0
+
+    @property
+    def headroom(self) -> float:
+        if self.character_limit is None:
+            return math.inf
+        return self.character_limit - self.character_count - SAFE_QUOTA_MARGIN
+
+
+class QuotaLedger:
+    """In-process view of the character quota of every ElevenLabs API key.
+
+    Quotas are fetched from the subscription endpoint every
+    QUOTA_REFRESH_INTERVAL seconds (or once a key's reset time has passed) and
+    characters are subtracted locally as requests are sent, so the common path
+    needs no HTTP round trip. Requests go to the usable key with the most
+    headroom that has a free concurrency slot.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.mtime = 0.0
+        self.quotas: list[KeyQuota] = []
+        self.condition = asyncio.Condition()
+        self.refresh_lock = asyncio.Lock()
+
+    def reload(self) -> None:
+        if (mtime := self.path.stat().st_mtime) == self.mtime:
+            return
+        self.mtime = mtime
+        quotas = {q.api_key.key: q for q in self.quotas}
+        self.quotas = []
+        for k in json.load(open(self.path)):
+            api_key = APIKey(**k)
+            if api_key.key in quotas:
+                quotas[api_key.key].api_key = api_key
+                self.quotas.append(quotas[api_key.key])
+            else:
+                self.quotas.append(KeyQuota(api_key))
+
+    def save(self) -> None:
+        json.dump(
+            [q.api_key.model_dump() for q in self.quotas],
+            open(self.path, "w"),
+            indent=4,
+        )
+        self.mtime = self.path.stat().st_mtime
+
+    async def refresh(self, quota: KeyQuota, client: httpx.AsyncClient) -> None:
+        try:
+            r = await client.get(
+                f"{ELEVENLABS_API_URL}/v1/user/subscription",
+                headers={"xi-api-key": quota.api_key.key},
+            )
+        except Exception as e:
+            logger.error(
+                f'Could not get EL subscription for "{quota.api_key.username}": {e}'
+            )
+            r = None
+        quota.refreshed = time.time()
+        if not r or not r.is_success:
+            if r:
+                logger.error(r.json()["detail"]["message"])
+            quota.character_limit = None
+            return
+        subscription = r.json()
+        quota.character_count = subscription["character_count"]
+        quota.character_limit = subscription["character_limit"]
+        quota.next_reset = subscription.get("next_character_count_reset_unix")
+
+    async def refresh_stale(self, force: bool = False) -> None:
+        async with self.refresh_lock:
+            self.reload()
+            now = time.time()
+            stale = [
+                q
+                for q in self.quotas
+                if q.api_key.use
+                and (
+                    force
+                    or now - q.refreshed > QUOTA_REFRESH_INTERVAL
+                    or (q.next_reset and now > q.next_reset)
                 )
-                for d, s in zip(seq[i + offset : i + offset + len(search)], search)
             ]
-        ):
-            result.append(
-                {
-                    "text": (
-                        (" ".join(s["text"] for s in seq[i : i + offset]) + " ")
-                        if offset
-                        else ""
-                    )
-                    + replacement,
-                    "start": seq[i]["start"],
-                    "length": max(
-                        sum(s["length"] for s in seq[i : i + offset + len(search)]),
-                        MIN_TIME * 1000,
-                    ),
-                }
+            if stale:
+                async with httpx.AsyncClient(timeout=60) as client:
+                    await asyncio.gather(*(self.refresh(q, client) for q in stale))
+        async with self.condition:
+            self.condition.notify_all()
+
+    def any_key(self) -> APIKey:
+        if key := next((q.api_key for q in self.quotas if q.api_key.use), None):
+            return key
+        raise ElevenLabsNoUsableKey("All API Keys are disabled")
+
+    async def acquire(self, characters: int) -> KeyQuota:
+        while True:
+            await self.refresh_stale()
+            async with self.condition:
+                while candidates := [
+                    q for q in self.quotas if q.api_key.use and q.headroom >= characters
+                ]:
+                    if free := [
+                        q for q in candidates if q.in_use < TTS_CONCURRENCY_PER_KEY
+                    ]:
+                        quota = max(free, key=lambda q: q.headroom)
+                        quota.in_use += 1
+                        quota.character_count += characters
+                        return quota
+                    await self.condition.wait()
+
+            resets = [
+                q.next_reset for q in self.quotas if q.api_key.use and q.next_reset
+            ]
+            wake = min(resets) if resets else time.time() + 60 * 60
+            logger.warning(
+                f"All API Keys out of quota - waiting until {datetime.datetime.fromtimestamp(wake)} for quota reset"
             )
-            i += len(search) + offset
-        else:
-            result.append(seq[i])
-            i += 1
+            await asyncio.sleep(max(wake - time.time(), 60))
+            await self.refresh_stale(force=True)
 
-    return result
+    async def release(self, quota: KeyQuota, refund: int = 0) -> None:
+        """Free the slot taken by `acquire`, giving back `refund` characters
+        that a failed request did not use."""
+        async with self.condition:
+            quota.in_use -= 1
+            quota.character_count = max(quota.character_count - refund, 0)
+            self.condition.notify_all()
 
+    def exhausted(self, quota: KeyQuota) -> None:
+        quota.character_limit = quota.character_count
 
-API_KEY_POINTER = 0
+    def disable(self, quota: KeyQuota) -> None:
+        quota.api_key.use = False
+        self.save()
 
 
 async def generate_voice_from_text(
-    text: str, voice: ELVoice, api_keys: list[APIKey]
-) -> tuple[pydub.AudioSegment, list[dict]]:
-    global API_KEY_POINTER
-    for f0, t0 in GLOBAL_REPLACE:
-        text = regex.compile(f0, regex.IGNORECASE).sub(t0, text)
-
-    texts = [text]
-    hours = 1
-    while True:
-        while not api_keys[API_KEY_POINTER].use:
-            API_KEY_POINTER = (
-                API_KEY_POINTER + 1 if API_KEY_POINTER + 1 < len(api_keys) else 0
-            )
+    text: str, session: ElevenLabsSession, ledger: QuotaLedger
+) -> tuple[bytes, list[dict]]:
+    voice = session.voice
 
+    while True:
+        quota = await ledger.acquire(len(text))
+        api_key = quota.api_key
+        refund = len(text)
         # SUCCESS
         try:
-            audio, alignment = await elevenlabs_tts_alignment(
-                text, voice, api_keys[API_KEY_POINTER].key
-            )
-            for f1, t1, offset in POST_REPLACE:
-                alignment = replace_sublist(alignment, f1, t1, offset, True)
-
-            return audio, alignment
+            audio, words = await elevenlabs_tts_alignment(text, session, api_key.key)
+            refund = 0
+            return audio, words.merge(POST_REPLACE, MIN_TIME * 1000).to_json()
         # TEMP ERROR
         except ElevenLabsVoiceIdDoesNotExist as e:
             logger.warning(
-                f'"{api_keys[API_KEY_POINTER].username}" does not recognise ID "{voice.id}"; please make sure you have added the voice "{voice.name}" to your library and the ID is correct. Retrying in 10 min: {e}'
+                f'"{api_key.username}" does not recognise ID "{voice.id}"; please make sure you have added the voice "{voice.name}" to your library and the ID is correct. Retrying in 10 min: {e}'
             )
-            await asyncio.sleep(10 * 60)
+            delay = 10 * 60
         except ElevenLabsSystemBusyError as e:
             logger.warning(
                 f"Elevenlabs servers busy, waiting 10 seconds for them to catch up: {e}"
             )
-            await asyncio.sleep(10)
+            delay = 10
         except ElevenLabsInputTimeoutExceededError as e:
             logger.warning(f"Mistiming of input text, retrying in 10 seconds: {e}")
-            await asyncio.sleep(10)
+            delay = 10
         except ElevenLabsSomethingWentWrong as e:
             logger.warning(f"Something went wrong, retrying in 10 min: {e}")
-            await asyncio.sleep(10 * 60)
+            delay = 10 * 60
         except websockets.exceptions.ConnectionClosedError as e:
             logger.warning(
                 f"Websocket connection closed unexpectedly, trying again in 10 seconds: {e}"
             )
-            await asyncio.sleep(10)
+            delay = 10
         # API KEY ERRORS
-        except (ElevenLabsQuotaExceededError, ElevenLabsSafeQuotaStop) as e:
-            API_KEY_POINTER += 1
-            if API_KEY_POINTER < len(api_keys):
-                logger.warning(
-                    f'"{api_keys[API_KEY_POINTER-1].username}" out of quota, trying next key: {e}'
-                )
-                if isinstance(e, ElevenLabsQuotaExceededError):
-                    await asyncio.sleep(random.randint(10, 60))
-            else:
-                API_KEY_POINTER = 0
-                logger.warning(
-                    f"All API Keys out of quota - waiting {hours} hours for quota reset"
-                )
-                await asyncio.sleep(hours * 60 * 60)
-                hours = min(24, hours + 1)
-
+        except ElevenLabsQuotaExceededError as e:
+            logger.warning(f'"{api_key.username}" out of quota, trying next key: {e}')
+            ledger.exhausted(quota)
+            refund = 0
+            delay = random.randint(10, 60)
         except ElevenLabsDetectedUnusualActivity as e:
             logger.warning(
-                f'Unusual activity detected for "{api_keys[API_KEY_POINTER].username}", disabling API Key!'
-            )
-            api_keys[API_KEY_POINTER].use = False
-
-            json.dump(
-                [k.model_dump() for k in api_keys],
-                open(ELEVENLABS_API_KEYS_JSON, "w"),
-                indent=4,
+                f'Unusual activity detected for "{api_key.username}", disabling API Key!'
             )
-            await asyncio.sleep(random.randint(10, 60))
+            ledger.disable(quota)
+            delay = random.randint(10, 60)
+        finally:
+            await ledger.release(quota, refund)
+        await asyncio.sleep(delay)
 
 
 def text_to_spans(text: str | list[str]) -> list:
@@ -489,13 +693,7 @@ def text_to_spans(text: str | list[str]) -> list:
 def generate_error_manuscript(article_id: str, scraping_url: str) -> dict:
     article_url = f"{scraping_url}/{article_id}"
 
-    res_dir = DB_DIR / ERROR_ID
-    res_dir.mkdir(parents=True, exist_ok=True)
-
-    audio_dir = res_dir / AUDIO_DIR_NAME
-    audio_dir.mkdir(parents=True, exist_ok=True)
-
-    article = {
+    article: dict = {
         "title": article_id.replace("_", " "),
         "url": None,
         "state": "error" if article_id != ERROR_ID else "done",
@@ -503,16 +701,12 @@ def generate_error_manuscript(article_id: str, scraping_url: str) -> dict:
         "sections": [
             {
                 "section_type": "h1",
-                "audio_url": f'/{((audio_dir / f"{0:04}.mp3").relative_to(DB_DIR.parent))}',
-                "alignment_url": f'/{((audio_dir / f"{0:04}.json").relative_to(DB_DIR.parent))}',
                 "spans": text_to_spans("Error"),
             }
         ]
         + [
             {
                 "section_type": "p",
-                "audio_url": f'/{((audio_dir / f"{i+1:04}.mp3").relative_to(DB_DIR.parent))}',
-                "alignment_url": f'/{((audio_dir / f"{i+1:04}.json").relative_to(DB_DIR.parent))}',
                 "spans": text_to_spans(s),
             }
             for i, s in enumerate(
@@ -522,16 +716,14 @@ def generate_error_manuscript(article_id: str, scraping_url: str) -> dict:
             )
         ],
         "group": "info",
-        "outro": {
-            "audio_url": f"/{(audio_dir / "outro.mp3").relative_to(DB_DIR.parent)}",
-        },
+        "outro": {},
     }
     if article_id != ERROR_ID:
         article["url"] = f"{scraping_url}/{article_id}"
     return article
 
 
-def generate_home_manuscript(audio_dir: pathlib.Path) -> dict:
+def generate_home_manuscript() -> dict:
     return {
         "title": "Empire Wikipedia Winds of Speech",
         "url": None,
@@ -540,15 +732,11 @@ def generate_home_manuscript(audio_dir: pathlib.Path) -> dict:
         "sections": [
             {
                 "section_type": "h1",
-                "audio_url": f"/{(audio_dir / f"{0:04}.mp3").relative_to(DB_DIR.parent)}",
-                "alignment_url": f"/{(audio_dir / f"{0:04}.json").relative_to(DB_DIR.parent)}",
                 "spans": text_to_spans("Empire Wikipedia Winds of Speech"),
             },
             *[
                 {
                     "section_type": "p",
-                    "audio_url": f"/{(audio_dir / f"{i+1:04}.mp3").relative_to(DB_DIR.parent)}",
-                    "alignment_url": f"/{(audio_dir / f"{i+1:04}.json").relative_to(DB_DIR.parent)}",
                     "spans": text_to_spans(text),
                 }
                 for i, text in enumerate(
@@ -568,8 +756,6 @@ def generate_home_manuscript(audio_dir: pathlib.Path) -> dict:
             *[
                 {
                     "section_type": "p",
-                    "audio_url": f"/{(audio_dir / f"{i+5:04}.mp3").relative_to(DB_DIR.parent)}",
-                    "alignment_url": f"/{(audio_dir / f"{i+5:04}.json").relative_to(DB_DIR.parent)}",
                     "spans": text_to_spans(text),
                 }
                 for i, text in enumerate(
@@ -582,38 +768,26 @@ def generate_home_manuscript(audio_dir: pathlib.Path) -> dict:
             ],
         ],
         "group": "info",
-        "outro": {
-            "audio_url": f"/{(audio_dir / "outro.mp3").relative_to(DB_DIR.parent)}",
-        },
+        "outro": {},
     }
 
 
 def generate_disallowed_manuscript(article_id: str, scraping_url: str) -> dict:
     article_url = f"{scraping_url}/{article_id}"
 
-    res_dir = DB_DIR / DISALLOWED_ID
-    res_dir.mkdir(parents=True, exist_ok=True)
-
-    audio_dir = res_dir / AUDIO_DIR_NAME
-    audio_dir.mkdir(parents=True, exist_ok=True)
-
-    article = {
+    article: dict = {
         "title": article_id.replace("_", " "),
         "url": None,
         "state": "disallowed" if article_id != DISALLOWED_ID else "done",
         "sections": [
             {
                 "section_type": "h1",
-                "audio_url": f"/{((audio_dir / f"{0:04}.mp3").relative_to(DB_DIR.parent))}",
-                "alignment_url": f"/{((audio_dir / f"{0:04}.json").relative_to(DB_DIR.parent))}",
                 "spans": text_to_spans("Disallowed article"),
             }
         ]
         + [
             {
                 "section_type": "p",
-                "audio_url": f"/{((audio_dir / f"{i+1:04}.mp3").relative_to(DB_DIR.parent))}",
-                "alignment_url": f"/{((audio_dir / f"{i+1:04}.json").relative_to(DB_DIR.parent))}",
                 "spans": text_to_spans(s),
             }
             for i, s in enumerate(
@@ -626,9 +800,7 @@ def generate_disallowed_manuscript(article_id: str, scraping_url: str) -> dict:
             )
         ],
         "group": "info",
-        "outro": {
-            "audio_url": f"/{(audio_dir / "outro.mp3").relative_to(DB_DIR.parent)}"
-        },
+        "outro": {},
     }
     if article_id != DISALLOWED_ID:
         article["url"] = f"{scraping_url}/{article_id}"
@@ -641,9 +813,7 @@ def has_class(content: bs4.Tag, class_name: str) -> bool:
     )
 
 
-def content_to_sections(
-    content: bs4.Tag, audio_dir: pathlib.Path
-) -> typing.Generator[dict, None, None]:
+def content_to_sections(content: bs4.Tag) -> typing.Generator[dict, None, None]:
     i = 0
     for child in content.findChildren(recursive=False):
         text = None
@@ -669,12 +839,6 @@ def content_to_sections(
                 if block := c.strip():
                     yield {
                         "section_type": "cite",
-                        "audio_url": my_url(
-                            f"/{(audio_dir / f"{i+1:04}.mp3").relative_to(DB_DIR.parent)}"
-                        ),
-                        "alignment_url": my_url(
-                            f"/{(audio_dir / f"{i+1:04}.json").relative_to(DB_DIR.parent)}"
-                        ),
                         "spans": text_to_spans(block),
                     }
                     i += 1
@@ -684,25 +848,13 @@ def content_to_sections(
         if text:
             yield {
                 "section_type": child.name,
-                "audio_url": my_url(
-                    f"/{(audio_dir / f"{i+1:04}.mp3").relative_to(DB_DIR.parent)}"
-                ),
-                "alignment_url": my_url(
-                    f"/{(audio_dir / f"{i+1:04}.json").relative_to(DB_DIR.parent)}"
-                ),
                 "spans": text_to_spans(text),
             }
             i += 1
 
 
-def get_api_revisions(
-    article_id: str, rvlimit: int = 500, rvstart: str | None = None
-) -> list:
-    url = (
-        f"{API_URL}?action=query&prop=revisions&format=json&titles={my_url(article_id)}"
-        + (f"&rvlimit={rvlimit}" if rvlimit else "")
-        + (f"&rvstart={urllib.parse.quote(rvstart)}" if rvstart else "")
-    )
+def get_api_page(article_id: str, query: str) -> dict:
+    url = f"{API_URL}?action=query&format=json&titles={my_url(article_id)}&{query}"
     while True:
         try:
             api_metadata_pages = list(
@@ -711,46 +863,63 @@ def get_api_revisions(
             break
         except httpx.ConnectTimeout as e:
             logger.warning(
-                f'Could not get api revisions for acticle "{article_id}" ({url}). Retrying in 10 seconds: {e}'
+                f'Could not query api for acticle "{article_id}" ({url}). Retrying in 10 seconds: {e}'
             )
             time.sleep(10)
 
     assert len(api_metadata_pages) == 1
-    return (
-        list(api_metadata_pages[0]["revisions"])
-        if "revisions" in api_metadata_pages[0]
-        else []
+    return dict(api_metadata_pages[0])
+
+
+def get_api_page_info(article_id: str) -> dict:
+    return get_api_page(
+        article_id, "prop=info|revisions&rvprop=ids|timestamp&rvlimit=1"
     )
 
 
-def generate_manuscript(
-    article_id: str, scraping_url: str, res_dir: pathlib.Path, audio_dir: pathlib.Path
-) -> dict:
-    url = my_url(f"{scraping_url}/{article_id}")
+def get_api_revisions(
+    article_id: str,
+    rvlimit: int = 500,
+    rvstart: str | None = None,
+    rvdir: str | None = None,
+) -> list:
+    page = get_api_page(
+        article_id,
+        "prop=revisions"
+        + (f"&rvlimit={rvlimit}" if rvlimit else "")
+        + (f"&rvstart={urllib.parse.quote(rvstart)}" if rvstart else "")
+        + (f"&rvdir={rvdir}" if rvdir else ""),
+    )
+    return list(page["revisions"]) if "revisions" in page else []
 
-    if any(r for r in DISALLOWED_ARTICLES if r.match(article_id)):
-        logger.warning(f'"{article_id}" is disallowed')
-        return generate_disallowed_manuscript(article_id, scraping_url)
 
-    if article_id == HOME_ID:
-        return generate_home_manuscript(audio_dir)
+def article_disallowed(article_id: str) -> bool:
+    return any(r for r in DISALLOWED_ARTICLES if r.match(article_id))
 
-    try:
-        response = httpx.get(url, verify=False, timeout=60)
-    except Exception as e:
-        logger.error(f'Could not get article "{url}": {e}')
-        return generate_error_manuscript(article_id, scraping_url)
 
-    if not response.is_success:
-        logger.error(f'Could not get article "{url}": {response}')
-        return generate_error_manuscript(article_id, scraping_url)
+class ArticleStrainer(bs4.SoupStrainer):
+    """Keeps the elements with the given ids, plus every h1 wherever it is,
+    since the first h1 of the page is taken as the article's title."""
+
+    def allow_tag_creation(
+        self, nsprefix: str | None, name: str, attrs: typing.Any
+    ) -> bool:
+        return name == "h1" or super().allow_tag_creation(nsprefix, name, attrs)  # type: ignore[misc]
 
-    soup = bs4.BeautifulSoup(response.text, "html.parser")
+
+ARTICLE_STRAINER = ArticleStrainer(id=["mw-content-text", "pageCategories"])
+
+
+def parse_article(
+    html: str,
+    features: str = "lxml",
+    parse_only: bs4.SoupStrainer | None = ARTICLE_STRAINER,
+) -> tuple[str, str | None, list[str], list[dict]]:
+    soup = bs4.BeautifulSoup(html, features, parse_only=parse_only)
     content = soup.find(id="mw-content-text")
 
     if not isinstance(content, bs4.Tag):
-        logger.error(f'Soup for "{url}" does not contain ID "mw-content-text"')
-        return generate_error_manuscript(article_id, scraping_url)
+        raise ValueError('does not contain ID "mw-content-text"')
 
     # Get image
     img_tag = content.find("img")
@@ -769,8 +938,7 @@ def generate_manuscript(
 
     title_tag = soup.find("h1")
     if not isinstance(title_tag, bs4.Tag):
-        logger.error(f'Soup for "{url}" does not contain h1 header')
-        return generate_error_manuscript(article_id, scraping_url)
+        raise ValueError("does not contain h1 header")
     title = title_tag.text.strip()
 
     toc = content.find("div", {"id": "toc"})
@@ -785,58 +953,76 @@ def generate_manuscript(
             or "ic" not in child["class"]
         ):
             child.decompose()
-    for child in content.find_all("sup"):
-        child.decompose()
-    for child in content.find_all("table"):
-        child.decompose()
+    for child in content.find_all(["sup", "table"]):
+        if not child.decomposed:  # already gone with an enclosing table
+            child.decompose()
 
-    (audio_dir / f"{0:04}").mkdir(parents=True, exist_ok=True)
+    return title, img_url, page_categories, list(content_to_sections(content))
 
-    sections = list(content_to_sections(content, audio_dir))
 
-    revisions = get_api_revisions(article_id)
-    if revisions:
-        while tmp_revisions := get_api_revisions(
-            article_id,
-            rvstart=(
-                dateutil.parser.parse(revisions[-1]["timestamp"])
-                - datetime.timedelta(seconds=1)
-            ).isoformat(),
-        ):
-            revisions += tmp_revisions
+def generate_manuscript(
+    article_id: str,
+    scraping_url: str,
+    page: dict | None = None,
+    created: datetime.datetime | None = None,
+) -> dict:
+    url = my_url(f"{scraping_url}/{article_id}")
+
+    if article_disallowed(article_id):
+        logger.warning(f'"{article_id}" is disallowed')
+        return generate_disallowed_manuscript(article_id, scraping_url)
+
+    if article_id == HOME_ID:
+        return generate_home_manuscript()
+
+    try:
+        response = httpx.get(url, verify=False, timeout=60)
+    except Exception as e:
+        logger.error(f'Could not get article "{url}": {e}')
+        return generate_error_manuscript(article_id, scraping_url)
+
+    if not response.is_success:
+        logger.error(f'Could not get article "{url}": {response}')
+        return generate_error_manuscript(article_id, scraping_url)
+
+    try:
+        title, img_url, page_categories, sections = parse_article(response.text)
+    except ValueError as e:
+        logger.error(f'Soup for "{url}" {e}')
+        return generate_error_manuscript(article_id, scraping_url)
+
+    latest_revisions = (
+        page["revisions"]
+        if page and "revisions" in page
+        else get_api_revisions(article_id, rvlimit=1)
+    )
+    if latest_revisions:
+        lastmod = dateutil.parser.parse(latest_revisions[0]["timestamp"])
+        if not created:
+            first_revisions = get_api_revisions(article_id, rvlimit=1, rvdir="newer")
+            created = (
+                dateutil.parser.parse(first_revisions[0]["timestamp"])
+                if first_revisions
+                else datetime.datetime.now()
+            )
     else:
         logger.error(f'Article does not have any revisions - "{article_id}"')
+        lastmod = datetime.datetime.now()
+        created = created or datetime.datetime.now()
 
-    article = {
+    article: dict = {
         "title": title,
         "url": url,
         "state": "generating",
         "group": scraping_url,
         "categories": page_categories,
-        "outro": {
-            "audio_url": my_url(
-                f"/{(audio_dir / "outro.mp3").relative_to(DB_DIR.parent)}"
-            ),
-        },
-        "lastmod": (
-            dateutil.parser.parse(revisions[0]["timestamp"])
-            if revisions
-            else datetime.datetime.now()
-        ),
-        "created": (
-            dateutil.parser.parse(revisions[-1]["timestamp"])
-            if revisions
-            else datetime.datetime.now()
-        ),
+        "lastrevid": page.get("lastrevid") if page else None,
+        "outro": {},
+        "lastmod": lastmod,
+        "created": created,
         "sections": [
             {
                 "section_type": "h1",
-                "audio_url": my_url(
-                    f"/{(audio_dir / f"{0:04}.mp3").relative_to(DB_DIR.parent)}"
-                ),
-                "alignment_url": my_url(
-                    f"/{(audio_dir / f"{0:04}.json").relative_to(DB_DIR.parent)}"
-                ),
                 "spans": text_to_spans(title),
             },
             *sections,
@@ -849,12 +1035,192 @@ def generate_manuscript(
     return article
 
 
+def audible_sections(manuscript: dict) -> typing.Iterator[tuple[int, dict]]:
+    """Sections that are part of the complete audio, with their index."""
+    for i, section in enumerate(manuscript["sections"]):
+        if section["section_type"] not in SECTION_TYPE_SKIP:
+            yield i, section
+
+
+def build_complete_audio(
+    manuscript: dict, f: typing.BinaryIO
+) -> tuple[list[dict], float]:
+    """Write the complete audio of `manuscript` to `f` and return its
+    transcript and duration in seconds. Section files are joined frame by frame, so this takes
+    constant memory regardless of the article's length."""
+    writer = mp3.Mp3Writer(f)
+    transcript: list[dict] = []
+    for _, section in audible_sections(manuscript):
+        if transcript:
+            if section["section_type"] not in SECTION_TYPE_PRE_DELAY:
+                logger.warning(
+                    f'"{section["section_type"]}" not in SECTION_TYPE_PRE_DELAY! Using default 1s'
+                )
+            writer.append_silence(
+                SECTION_TYPE_PRE_DELAY.get(section["section_type"], 1)
+            )
+
+        transcript.append(
+            {
+                "type": section["section_type"],
+                "body": " ".join(s["text"] for s in section["spans"]),
+                "startTime": writer.seconds,
+            }
+        )
+        writer.append(url_to_path(section["audio_url"]))
+
+    if not transcript:
+        return transcript, 0
+
+    if "outro" in manuscript and "audio_url" in manuscript["outro"]:
+        writer.append_silence(OUTRO_PRE_DELAY)
+        writer.append(url_to_path(manuscript["outro"]["audio_url"]))
+    else:
+        logger.warning(
+            f'"{manuscript["title"]}" has no "outro" or "outro" has no "audio_url"'
+        )
+
+    writer.append_silence(OUTRO_POST_SILENCE)
+    return transcript, writer.seconds
+
+
+def build_alignments(manuscript: dict) -> list[list[dict] | None]:
+    """The alignment of every section in one list, in section order, with
+    None for sections that have none, so a player can load them all in one
+    request."""
+    alignments: list[list[dict] | None] = []
+    for section in manuscript["sections"]:
+        if "alignment_url" in section:
+            with open(url_to_path(section["alignment_url"])) as f:
+                alignments.append(json.load(f))
+        else:
+            alignments.append(None)
+    return alignments
+
+
+def build_timeline(
+    manuscript: dict,
+    transcript: list[dict],
+    alignments: list[list[dict] | None],
+) -> dict[str, typing.Any]:
+    """Word timings of the complete audio, as parallel lists sorted by start
+    (milliseconds into the complete file) with the section and span each
+    word belongs to, plus where every section starts."""
+    timeline: dict[str, typing.Any] = {
+        "section": [],
+        "span": [],
+        "start": [],
+        "length": [],
+        "section_start": {},
+    }
+    for (i, section), segment in zip(audible_sections(manuscript), transcript):
+        offset = segment["startTime"] * 1000
+        timeline["section_start"][i] = round(offset)
+        for j, word in enumerate((alignments[i] or [])[: len(section["spans"])]):
+            timeline["section"].append(i)
+            timeline["span"].append(j)
+            timeline["start"].append(round(offset + word["start"]))
+            timeline["length"].append(round(word["length"]))
+    return timeline
+
+
+def hashed_path(path: pathlib.Path, digest: str) -> pathlib.Path:
+    """`path` with the start of the content's `digest` before its suffix, so
+    the file can be cached forever under its URL."""
+    return path.with_name(f"{path.stem}.{digest[:ARTIFACT_HASH_LENGTH]}{path.suffix}")
+
+
+def write_artifact(path: pathlib.Path, data: bytes) -> pathlib.Path:
+    path = hashed_path(path, hashlib.sha256(data).hexdigest())
+    audio_store.write_atomic(path, data)
+    return path
+
+
+def audio_tags_version(manuscript: dict) -> str:
+    """Changes whenever the tags written by `audio_tag` would, apart from the
+    chapters, which only change with the complete audio itself."""
+    return hashlib.sha256(
+        json.dumps(
+            [
+                manuscript["title"],
+                AUDIO_TAG_ALBUM,
+                AUDIO_TAG_ARTIST,
+                CHAPTER_SEGMENT_TYPE,
+            ]
+        ).encode()
+    ).hexdigest()[:ARTIFACT_HASH_LENGTH]
+
+
+def audio_tags_stale(manuscript: dict) -> bool:
+    return manuscript.get("audio_tags") != audio_tags_version(manuscript)
+
+
+def audio_tag(title: str, transcript: list[dict], duration: float) -> bytes:
+    """ID3v2 tag for the complete audio, with a chapter for every
+    CHAPTER_SEGMENT_TYPE segment of the transcript."""
+    tag = mutagen.id3.ID3()
+    tag.add(mutagen.id3.TSSE(text=["wiki-tts"]))
+    tag.add(mutagen.id3.TIT2(text=[title]))
+    tag.add(mutagen.id3.TALB(text=[AUDIO_TAG_ALBUM]))
+    tag.add(mutagen.id3.TPE1(text=[AUDIO_TAG_ARTIST]))
+
+    chapters = [s for s in transcript if s["type"] == CHAPTER_SEGMENT_TYPE]
+    # Element ids are written as Latin-1, so the chapter titles go in the
+    # sub-frames
+    element_ids = [f"chp{i}" for i in range(len(chapters))]
+    tag.add(
+        mutagen.id3.CTOC(
+            element_id="toc",
+            flags=mutagen.id3.CTOCFlags.TOP_LEVEL | mutagen.id3.CTOCFlags.ORDERED,
+            child_element_ids=element_ids,
+            sub_frames=[mutagen.id3.TIT2(text=["TOC"])],
+        )
+    )
+    for i, chapter in enumerate(chapters):
+        tag.add(
+            mutagen.id3.CHAP(
+                element_id=element_ids[i],
+                start_time=int(chapter["startTime"] * 1000),
+                end_time=int(
+                    (
+                        chapters[i + 1]["startTime"]
+                        if i < len(chapters) - 1
+                        else duration
+                    )
+                    * 1000
+                ),
+                sub_frames=[mutagen.id3.TIT2(text=[chapter["body"]])],
+            )
+        )
+
+    f = io.BytesIO()
+    tag.save(f, padding=lambda info: 0)
+    return f.getvalue()
+
+
+def write_complete_audio(
+    path: pathlib.Path, tag: bytes, audio: typing.BinaryIO
+) -> pathlib.Path:
+    """Write `tag` followed by the rest of `audio` next to `path`, named by
+    the hash of the result."""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "w+b") as f:
+            f.write(tag)
+            shutil.copyfileobj(audio, f)
+            f.seek(0)
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        path = hashed_path(path, digest)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
 def generate_complete_audio(article_id: str) -> None:
     article_id = article_id.replace(" ", "_")
 
-    manuscript = COLLECTION.find_one({"_id": article_id})
-    sound = None
-    transcript = []
+    manuscript = COLLECTION.find_one({"_id": article_id}, WITHOUT_TRANSCRIPT)
     if not manuscript:
         logger.warning(f'Could not find "{article_id}"')
         return
@@ -864,71 +1230,44 @@ def generate_complete_audio(article_id: str) -> None:
         )
         return
 
-    for section in manuscript["sections"]:
-        if section["section_type"] not in SECTION_TYPE_SKIP:
-            if sound:
-                if section["section_type"] not in SECTION_TYPE_PRE_DELAY:
-                    logger.warning(
-                        f'"{section["section_type"]}" not in SECTION_TYPE_PRE_DELAY! Using default 1s'
-                    )
-                    sound = sound.append(
-                        pydub.AudioSegment.silent(duration=1000),
-                        crossfade=0,
-                    )
-                else:
-                    sound = sound.append(
-                        pydub.AudioSegment.silent(
-                            duration=int(
-                                SECTION_TYPE_PRE_DELAY[section["section_type"]] * 1000
-                            )
-                        ),
-                        crossfade=0,
-                    )
-            else:
-                sound = pydub.AudioSegment.silent(duration=0)
-
-            transcript.append(
-                {
-                    "type": section["section_type"],
-                    "body": " ".join(s["text"] for s in section["spans"]),
-                    "startTime": len(sound) / 1000,
-                }
-            )
-            sound = sound.append(
-                pydub.AudioSegment.from_file(
-                    url_to_path(section["audio_url"]), format="mp3"
-                ),
-                crossfade=0,
-            )
-
-    if not sound:
-        logger.error(f'No sections in "{article_id}"!')
-        return
+    audio_dir = DB_DIR / article_id / AUDIO_DIR_NAME
+    audio_dir.mkdir(parents=True, exist_ok=True)
 
-    if "outro" in manuscript and "audio_url" in manuscript["outro"]:
-        sound = sound.append(
-            pydub.AudioSegment.silent(duration=OUTRO_PRE_DELAY * 1000), crossfade=0
-        )
-        sound = sound.append(
-            pydub.AudioSegment.from_file(
-                url_to_path(manuscript["outro"]["audio_url"]), format="mp3"
-            ),
-            crossfade=0,
-        )
-    else:
-        logger.warning(
-            f'"{manuscript["title"]}" has no "outro" or "outro" has no "audio_url"'
+    # The chapters in the tag are only known once the audio is written, so
+    # the frames go to a scratch file first
+    with tempfile.TemporaryFile(dir=audio_dir) as f:
+        transcript, duration = build_complete_audio(manuscript, f)
+        if not transcript:
+            logger.error(f'No sections in "{article_id}"!')
+            return
+        f.seek(0)
+        audio_path = write_complete_audio(
+            audio_dir / f"{article_id}.mp3",
+            audio_tag(manuscript["title"], transcript, duration),
+            f,
         )
 
-    sound = sound.append(
-        pydub.AudioSegment.silent(duration=OUTRO_POST_SILENCE * 1000), crossfade=0
+    alignments = build_alignments(manuscript)
+    alignments_path = write_artifact(
+        audio_dir / f"{article_id}.alignments.json",
+        json.dumps(alignments, separators=(",", ":")).encode(),
+    )
+    timeline_path = write_artifact(
+        audio_dir / f"{article_id}.timeline.json",
+        json.dumps(
+            build_timeline(manuscript, transcript, alignments), separators=(",", ":")
+        ).encode(),
     )
 
-    audio_dir = DB_DIR / article_id / AUDIO_DIR_NAME
-    audio_dir.mkdir(parents=True, exist_ok=True)
-
-    audio_path = audio_dir / f"{article_id}.mp3"
-    sound.export(audio_path, bitrate=f"{ELEVENLABS_BITRATE//1000}k", format="mp3")
+    # Stored for the podcast feed so it does not have to read the audio file
+    # or render the summaries for every episode
+    summary, long_summary = episode_summaries(manuscript)
+    episode = {
+        "size": audio_path.stat().st_size,
+        "duration": duration,
+        "summary": summary,
+        "long_summary": long_summary,
+    }
 
     COLLECTION.update_one(
         {"_id": manuscript["_id"]},
@@ -937,17 +1276,92 @@ def generate_complete_audio(article_id: str) -> None:
                 "complete_audio_url": my_url(
                     f"/{audio_path.relative_to(DB_DIR.parent)}"
                 ),
+                "alignments_url": my_url(
+                    f"/{alignments_path.relative_to(DB_DIR.parent)}"
+                ),
+                "timeline_url": my_url(f"/{timeline_path.relative_to(DB_DIR.parent)}"),
                 "transcript": transcript,
+                "episode": episode,
+                "audio_tags": audio_tags_version(manuscript),
+                "modified": datetime.datetime.now(datetime.UTC),
             }
         },
     )
+    # The podcast feed only lists manuscripts with complete audio
+    touch_meta()
     logger.info(f'Complete audio done for "{manuscript["title"]}"')
 
 
-def generate_audio(manuscript: dict, task: str, api_keys: list[APIKey]) -> None:
-    global API_KEY_POINTER
+def tag_complete_audio(article_id: str) -> None:
+    """Rewrite the tags of the complete audio of `article_id` into a new file,
+    for when they changed but the audio did not."""
+    manuscript = COLLECTION.find_one(
+        {"_id": article_id},
+        {"title": 1, "complete_audio_url": 1, "transcript": 1, "episode": 1},
+    )
+    if not manuscript or "complete_audio_url" not in manuscript:
+        logger.warning(f'No complete audio to tag for "{article_id}"')
+        return
+
+    old_path = url_to_path(manuscript["complete_audio_url"])
+    duration = (
+        manuscript["episode"]["duration"]
+        if "episode" in manuscript
+        else mutagen.File(old_path).info.length
+    )
+    with open(old_path, "rb") as f:
+        f.seek(mp3.id3v2_length(f.read(10)))
+        audio_path = write_complete_audio(
+            old_path.parent / f"{article_id}.mp3",
+            audio_tag(manuscript["title"], manuscript["transcript"], duration),
+            f,
+        )
+
+    COLLECTION.update_one(
+        {"_id": article_id},
+        {
+            "$set": {
+                "complete_audio_url": my_url(
+                    f"/{audio_path.relative_to(DB_DIR.parent)}"
+                ),
+                "episode.size": audio_path.stat().st_size,
+                "audio_tags": audio_tags_version(manuscript),
+                "modified": datetime.datetime.now(datetime.UTC),
+            }
+        },
+    )
+    touch_meta()
+    logger.info(f'Tagged complete audio of "{manuscript["title"]}"')
+
+
+def store_url(path: pathlib.Path) -> str:
+    return f"/{path.relative_to(DB_DIR.parent)}"
+
 
-    tmp_voice = random.choice([v for v in VOICES if v["use"]])
+async def synthesize(
+    text: str, session: ElevenLabsSession, ledger: QuotaLedger
+) -> tuple[str, bool]:
+    text = PRONUNCIATION.normalize(text)
+    key = audio_store.section_key(
+        text, str(session.voice.id), session.voice.model, audio_transform_key()
+    )
+
+    async def create() -> tuple[bytes, list[dict]]:
+        audio, timings = await generate_voice_from_text(text, session, ledger)
+        if AUDIO_TARGET_DBFS is not None:
+            audio = await asyncio.to_thread(transform_audio, audio, AUDIO_TARGET_DBFS)
+        return audio, timings
+
+    return key, await STORE.ensure(key, create)
+
+
+async def generate_audio(manuscript: dict, task: str, ledger: QuotaLedger) -> None:
+    voices = [v for v in VOICES if v["use"]]
+    # The voice is part of every section's store key, so an article keeps its
+    # voice when it is regenerated
+    tmp_voice = next(
+        (v for v in voices if v["nickname"] == manuscript.get("voice")), None
+    )
     if "forced_voice" in manuscript:
         v = next(
             (v for v in VOICES if v["nickname"] == manuscript["forced_voice"]), None
@@ -958,61 +1372,77 @@ def generate_audio(manuscript: dict, task: str, api_keys: list[APIKey]) -> None:
             logger.warning(
                 f'Forced voice "{manuscript["forced_voice"]}" does not exist in config, please add'
             )
+        tmp_voice = tmp_voice or random.choice(voices)
         logger.info(
             f'Chose forced voice "{tmp_voice["nickname"]}" for "{manuscript["title"]}"'
         )
+    elif tmp_voice:
+        logger.info(
+            f'Reusing voice "{tmp_voice["nickname"]}" for "{manuscript["title"]}"'
+        )
     else:
+        tmp_voice = random.choice(voices)
         logger.info(
             f'Chose voice "{tmp_voice["nickname"]}" for "{manuscript["title"]}"'
         )
+    manuscript["voice"] = tmp_voice["nickname"]
 
     voice = ELVoice(**tmp_voice)
-    if isinstance(voice.id, str):
-        _r = httpx.get(
-            f"https://api.elevenlabs.io/v1/voices/{voice.id}",
-            headers={"xi-api-key": api_keys[API_KEY_POINTER].key},
-            timeout=60,
-        )
-        voice.name = _r.json()["name"]
-    else:
-        for _i in voice.id:
-            _r = httpx.get(
-                f"https://api.elevenlabs.io/v1/voices/{_i}",
-                headers={"xi-api-key": api_keys[API_KEY_POINTER].key},
-                timeout=60,
-            )
-            if _r.is_success:
-                voice.id = _i
-                voice.name = _r.json()["name"]
-                break
+    await ledger.refresh_stale()
+    async with httpx.AsyncClient(
+        timeout=60, headers={"xi-api-key": ledger.any_key().key}
+    ) as client:
+        if isinstance(voice.id, str):
+            _r = await client.get(f"{ELEVENLABS_API_URL}/v1/voices/{voice.id}")
+            voice.name = _r.json()["name"]
+        else:
+            for _i in voice.id:
+                _r = await client.get(f"{ELEVENLABS_API_URL}/v1/voices/{_i}")
+                if _r.is_success:
+                    voice.id = _i
+                    voice.name = _r.json()["name"]
+                    break
 
-    for i, section in enumerate(manuscript["sections"]):
-        COLLECTION.update_one(
-            {"_id": manuscript["_id"]},
-            {"$set": {"progress": i / len(manuscript["sections"])}},
-        )
+    sections = manuscript["sections"]
+    done = 0
 
+    async def generate_section(section: dict) -> bool:
+        nonlocal done
+        stored = False
         if text := " ".join(s["text"] for s in section["spans"]).strip():
-            audio, alignment = asyncio.run(
-                generate_voice_from_text(text, voice, api_keys)
-            )
+            key, stored = await synthesize(text, session, ledger)
+            section["audio_url"] = store_url(STORE.audio_path(key))
+            section["alignment_url"] = store_url(STORE.alignment_path(key))
             if section["section_type"] == "ul" or section["section_type"] == "ol":
-                for s in section["spans"]:
-                    alignment = replace_sublist(
-                        alignment, s["text"].split(), s["text"], 0, False
+                variant = audio_store.variant_key([s["text"] for s in section["spans"]])
+                if not STORE.alignment_path(key, variant).exists():
+                    words = alignment.Alignment.from_json(STORE.load_alignment(key))
+                    words = words.merge(
+                        [
+                            alignment.Rule(s["text"].split(), s["text"])
+                            for s in section["spans"]
+                        ],
+                        MIN_TIME * 1000,
                     )
+                    STORE.put_alignment(key, words.to_json(), variant)
+                section["alignment_url"] = store_url(STORE.alignment_path(key, variant))
 
-            audio.export(
-                url_to_path(section["audio_url"]),
-                bitrate=f"{ELEVENLABS_BITRATE//1000}k",
-                format="mp3",
-            )
-            json.dump(alignment, open(url_to_path(section["alignment_url"]), "w"))
-            logger.info(f'"{manuscript["title"]}" {i}/{len(manuscript["sections"])-1}')
-        else:
-            logger.info(f'"{manuscript["title"]}" {i}/{len(manuscript["sections"])-1}')
-    audio, _ = asyncio.run(
-        generate_voice_from_text(
+        done += 1
+        await asyncio.to_thread(
+            COLLECTION.update_one,
+            {"_id": manuscript["_id"]},
+            {
+                "$set": {
+                    "progress": done / len(sections),
+                    "modified": datetime.datetime.now(datetime.UTC),
+                }
+            },
+        )
+        logger.info(f'"{manuscript["title"]}" {done}/{len(sections)}')
+        return stored
+
+    async def generate_outro() -> None:
+        key, _ = await synthesize(
             f'This article was read aloud by the artificial voice, "{voice.nickname}".'
             + (
                 " All content of this article is the original work of Profound Decisions and can be found on the Empire wikipedia."
@@ -1020,47 +1450,100 @@ def generate_audio(manuscript: dict, task: str, api_keys: list[APIKey]) -> None:
                 else ""
             )
             + " Thank you for listening.",
-            voice,
-            api_keys,
+            session,
+            ledger,
         )
+        manuscript["outro"] = {"audio_url": store_url(STORE.audio_path(key))}
+
+    session = ElevenLabsSession(voice)
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(generate_section(section)) for section in sections]
+            tg.create_task(generate_outro())
+    finally:
+        await session.close()
+
+    logger.info(
+        f'All TTS segments done for "{manuscript["title"]}" ({sum(t.result() for t in tasks)} reused from store)'
     )
-    audio.export(
-        url_to_path(manuscript["outro"]["audio_url"]),
-        bitrate=f"{ELEVENLABS_BITRATE//1000}k",
-        format="mp3",
+
+
+def touch_meta() -> None:
+    """Tell the podcast feed and the sitemap that the catalog changed."""
+    META.update_one(
+        {"_id": "meta"},
+        {"$set": {"lastmodified": datetime.datetime.now(datetime.UTC)}},
     )
-    logger.info(f'All TTS segments done for "{manuscript["title"]}"')
 
 
 def insert_or_replace(manuscript: dict) -> None:
+    manuscript["modified"] = datetime.datetime.now(datetime.UTC)
+    manuscript["cost"] = manuscript_cost(manuscript)
     try:
         COLLECTION.insert_one(manuscript)
     except pymongo.errors.DuplicateKeyError:
         COLLECTION.replace_one({"_id": manuscript["_id"]}, manuscript)
 
-    META.update_one(
+    touch_meta()
+
+
+async def insert_or_replace_async(manuscript: dict) -> None:
+    manuscript["modified"] = datetime.datetime.now(datetime.UTC)
+    manuscript["cost"] = manuscript_cost(manuscript)
+    try:
+        await ASYNC_COLLECTION.insert_one(manuscript)
+    except pymongo.errors.DuplicateKeyError:
+        await ASYNC_COLLECTION.replace_one({"_id": manuscript["_id"]}, manuscript)
+
+    await ASYNC_META.update_one(
         {"_id": "meta"},
         {"$set": {"lastmodified": datetime.datetime.now(datetime.UTC)}},
     )
 
 
-def update_manuscript(manuscript: dict, task: str = "Updating manuscript") -> None:
-    generate_audio(
-        manuscript,
-        task,
-        [APIKey(**k) for k in json.load(open(ELEVENLABS_API_KEYS_JSON))],
-    )
+async def update_manuscript(
+    manuscript: dict, ledger: QuotaLedger, task: str = "Updating manuscript"
+) -> None:
+    await generate_audio(manuscript, task, ledger)
     manuscript["state"] = "done"
-    insert_or_replace(manuscript)
+    await asyncio.to_thread(insert_or_replace, manuscript)
+    if manuscript["_id"] in PLACEHOLDER_STATES:
+        await asyncio.to_thread(update_placeholders, manuscript)
+
+
+def use_placeholder_audio(manuscript: dict, placeholder_id: str) -> None:
+    """Point the sections and outro of an error or disallowed manuscript at
+    the audio of `placeholder_id`, once that has been generated."""
+    placeholder = COLLECTION.find_one(
+        {"_id": placeholder_id, "state": "done"}, {"sections": 1, "outro": 1}
+    )
+    if placeholder and "audio_url" in placeholder.get("outro", {}):
+        manuscript["sections"] = placeholder["sections"]
+        manuscript["outro"] = placeholder["outro"]
 
-    generate_complete_audio(manuscript["_id"])
+
+def update_placeholders(placeholder: dict) -> None:
+    """Give every manuscript read with `placeholder`'s audio its new audio,
+    including those stored before it was first generated."""
+    COLLECTION.update_many(
+        {"state": PLACEHOLDER_STATES[placeholder["_id"]]},
+        {
+            "$set": {
+                "sections": placeholder["sections"],
+                "outro": placeholder["outro"],
+                "modified": datetime.datetime.now(datetime.UTC),
+            }
+        },
+    )
 
 
-def get_article(article_id: str) -> typing.Any:
+async def get_article(
+    article_id: str, projection: dict[str, typing.Any] | None = None
+) -> typing.Any:
     article_id = article_id.replace(" ", "_")
     if not article_id:
         article_id = HOME_ID
-    return COLLECTION.find_one({"_id": article_id})
+    return await ASYNC_COLLECTION.find_one({"_id": article_id}, projection)
 
 
 def tmp_morph(section: dict) -> dict:
@@ -1073,147 +1556,558 @@ def tmp_morph(section: dict) -> dict:
     return section
 
 
-def article_processor(queue: multiprocessing.Queue) -> None:
-    global API_KEY_POINTER
+def manuscript_cost(manuscript: dict | None) -> int:
+    if not manuscript or "sections" not in manuscript:
+        return 0
+    return sum(
+        len(span["text"])
+        for section in manuscript["sections"]
+        for span in section["spans"]
+    )
+
+
+def claim_article(article_id: str, scraping_url: str) -> bool:
+    with IN_PIPELINE_LOCK:
+        if article_id in IN_PIPELINE:
+            IN_PIPELINE[article_id] = scraping_url
+            return False
+        IN_PIPELINE[article_id] = None
+        return True
+
+
+def release_article(
+    article_id: str, article_scheduler: scheduler.ArticleScheduler
+) -> None:
+    with IN_PIPELINE_LOCK:
+        scraping_url = IN_PIPELINE.pop(article_id, None)
+    # The article may have been edited since this run parsed it
+    if scraping_url:
+        article_scheduler.put(article_id, scraping_url, scheduler.PRIORITY_REFRESH)
+
+
+def manuscript_audio_missing(manuscript: dict) -> bool:
+    for section in manuscript["sections"]:
+        if section["section_type"] in SECTION_TYPE_SKIP or not section["spans"]:
+            continue
+        for key in ["audio_url", "alignment_url"]:
+            if key not in section or not url_to_path(section[key]).exists():
+                return True
+    outro = manuscript.get("outro", {})
+    return "audio_url" not in outro or not url_to_path(outro["audio_url"]).exists()
+
+
+def complete_audio_missing(manuscript: dict) -> bool:
+    return (
+        "complete_audio_url" not in manuscript
+        or "transcript" not in manuscript
+        or "alignments_url" not in manuscript
+        or "timeline_url" not in manuscript
+        or not url_to_path(manuscript["complete_audio_url"]).exists()
+        or not url_to_path(manuscript["alignments_url"]).exists()
+        or not url_to_path(manuscript["timeline_url"]).exists()
+    )
+
+
+def prepare_article(
+    article_id: str, scraping_url: str, article_scheduler: scheduler.ArticleScheduler
+) -> tuple[dict, str] | None:
+    existing_manuscript = COLLECTION.find_one({"_id": article_id}, WITHOUT_TRANSCRIPT)
+
+    page = None
+    if article_id not in ALWAYS_REFRESH and not article_disallowed(article_id):
+        page = get_api_page_info(article_id)
+        lastrevid = page.get("lastrevid")
+        if (
+            lastrevid
+            and existing_manuscript
+            and existing_manuscript.get("lastrevid") == lastrevid
+            and existing_manuscript["state"] == "done"
+            and article_id not in ALWAYS_UPDATE
+            and not manuscript_audio_missing(existing_manuscript)
+        ):
+            logger.info(
+                f'Article "{existing_manuscript["title"]}" ({existing_manuscript["url"]}) unchanged since revision {lastrevid}, skipping'
+            )
+            return None
+
+    manuscript = {
+        "_id": article_id,
+        **generate_manuscript(
+            article_id,
+            scraping_url,
+            page,
+            existing_manuscript.get("created") if existing_manuscript else None,
+        ),
+    }
+    # Keep the voice so unchanged sections are found in the store
+    if existing_manuscript and "voice" in existing_manuscript:
+        manuscript["voice"] = existing_manuscript["voice"]
+
+    if manuscript["state"] == "disallowed":
+        manuscript["lastmod"] = datetime.datetime.now()
+        use_placeholder_audio(manuscript, DISALLOWED_ID)
+        insert_or_replace(manuscript)
+        article_scheduler.put(
+            DISALLOWED_ID, scraping_url, scheduler.PRIORITY_BACKGROUND
+        )
+        return None
+    elif manuscript["state"] == "error":
+        manuscript["lastmod"] = datetime.datetime.now()
+        use_placeholder_audio(manuscript, ERROR_ID)
+        insert_or_replace(manuscript)
+        article_scheduler.put(ERROR_ID, scraping_url, scheduler.PRIORITY_BACKGROUND)
+        return None
+
+    if existing_manuscript:
+        if manuscript["_id"] in ALWAYS_UPDATE:
+            logger.warning(
+                f'Article "{manuscript["title"]}" ({manuscript["_id"]}) in "always update", updating manuscript'
+            )
+            return manuscript, "Updating manuscript"
+        elif (
+            "state" in existing_manuscript
+            and existing_manuscript["state"] == "generating"
+        ):
+            logger.warning(
+                f'Article "{manuscript["title"]}" ({manuscript["url"]}) interrupted during generation, re-generating manuscript'
+            )
+            return manuscript, "Updating manuscript"
+        elif manuscript_audio_missing(existing_manuscript):
+            logger.warning(
+                f'Article "{manuscript["title"]}" ({manuscript["url"]}) is missing generated files, regenerating files'
+            )
+            return manuscript, "Updating manuscript"
+        elif manuscript_changed(manuscript, existing_manuscript):
+            if REFRESH_ARTICLES or manuscript["_id"] in ALWAYS_REFRESH:
+                logger.info(
+                    f'Article "{manuscript["title"]}" ({manuscript["url"]}) changed, updating manuscript'
+                )
+                return manuscript, "Updating manuscript"
+            else:
+                logger.warning(
+                    f'Article "{manuscript["title"]}" ({manuscript["url"]}) changed, but manuscript updating disabled - skipping'
+                )
+        else:
+            logger.info(
+                f'Article "{manuscript["title"]}" ({manuscript["url"]}) unchanged, skipping'
+            )
+            if manuscript.get("lastrevid"):
+                COLLECTION.update_one(
+                    {"_id": article_id},
+                    {
+                        "$set": {
+                            "lastrevid": manuscript["lastrevid"],
+                            "lastmod": manuscript["lastmod"],
+                            "modified": datetime.datetime.now(datetime.UTC),
+                        }
+                    },
+                )
+        return None
+    else:
+        logger.info(
+            f'Article "{manuscript["title"]}" ({manuscript["url"]}) not yet generated, generating manuscript'
+        )
+        return manuscript, "Generating manuscript"
+
+
+def record_stage(article_id: str, stage: str, start: float) -> None:
+    if PIPELINE_STATS:
+        STATS.insert_one(
+            {
+                "article_id": article_id,
+                "stage": stage,
+                "seconds": time.monotonic() - start,
+                "finished": datetime.datetime.now(datetime.UTC),
+            }
+        )
+
+
+def parse_stage(
+    article_scheduler: scheduler.ArticleScheduler,
+    tts_queue: queue.Queue,
+    assembly_queue: queue.Queue,
+) -> None:
     while True:
-        API_KEY_POINTER = 0
-        article_id, scraping_url = queue.get(block=True, timeout=None)
+        article_id, scraping_url = article_scheduler.get()
 
         logger.info(
-            f'Processing "{article_id}" ({queue.qsize()} articles left in queue)'
+            f'Processing "{article_id}" ({article_scheduler.qsize()} articles left in queue)'
         )
         if not GENERATE_ARTICLES:
             logger.info(
-                f'Article generation disabled, skipping "{article_id}" ({queue.qsize()} articles left in queue)'
+                f'Article generation disabled, skipping "{article_id}" ({article_scheduler.qsize()} articles left in queue)'
+            )
+            continue
+        if not claim_article(article_id, scraping_url):
+            logger.info(
+                f'"{article_id}" is already in the pipeline, queueing it again when done'
             )
             continue
 
-        res_dir = DB_DIR / article_id
-        res_dir.mkdir(parents=True, exist_ok=True)
+        start = time.monotonic()
+        try:
+            job = prepare_article(article_id, scraping_url, article_scheduler)
+        except httpx.ConnectError as e:
+            logger.warning(f'Could not GET article "{article_id}": {e}')
+            job = None
+        except Exception as e:
+            logger.exception(f'Could not prepare article "{article_id}": {e}')
+            release_article(article_id, article_scheduler)
+            continue
+        logger.debug(f'Parsed "{article_id}" in {time.monotonic() - start:.2f}s')
+        record_stage(article_id, "parse", start)
+
+        if job:
+            tts_queue.put(job)
+        elif (
+            (
+                a := COLLECTION.find_one(
+                    {"_id": article_id},
+                    {
+                        "state": 1,
+                        "complete_audio_url": 1,
+                        "alignments_url": 1,
+                        "timeline_url": 1,
+                        "transcript": {"$slice": 1},
+                        "title": 1,
+                        "audio_tags": 1,
+                    },
+                )
+            )
+            and a["state"] == "done"
+            and complete_audio_missing(a)
+        ):
+            assembly_queue.put((article_id, True, generate_complete_audio))
+        elif a and a["state"] == "done" and audio_tags_stale(a):
+            assembly_queue.put((article_id, False, tag_complete_audio))
+        else:
+            release_article(article_id, article_scheduler)
+
+
+async def tts_article(
+    manuscript: dict,
+    task: str,
+    ledger: QuotaLedger,
+    assembly_queue: queue.Queue,
+    article_scheduler: scheduler.ArticleScheduler,
+    slots: asyncio.Semaphore,
+) -> None:
+    start = time.monotonic()
+    try:
+        await update_manuscript(manuscript, ledger, task)
+    except Exception as e:
+        logger.exception(f'Could not generate audio for "{manuscript["_id"]}": {e}')
+        await asyncio.to_thread(release_article, manuscript["_id"], article_scheduler)
+        return
+    finally:
+        slots.release()
+    logger.debug(
+        f'Generated audio for "{manuscript["_id"]}" in {time.monotonic() - start:.2f}s'
+    )
+    await asyncio.to_thread(record_stage, manuscript["_id"], "tts", start)
+    await asyncio.to_thread(
+        assembly_queue.put,
+        (manuscript["_id"], task != "Manuscript error", generate_complete_audio),
+    )
 
-        audio_dir = res_dir / AUDIO_DIR_NAME
-        audio_dir.mkdir(parents=True, exist_ok=True)
 
-        try:
-            manuscript = {
-                "_id": article_id,
-                **generate_manuscript(article_id, scraping_url, res_dir, audio_dir),
-            }
+async def tts_stage(
+    tts_queue: queue.Queue,
+    assembly_queue: queue.Queue,
+    article_scheduler: scheduler.ArticleScheduler,
+) -> None:
+    ledger = QuotaLedger(ELEVENLABS_API_KEYS_JSON)
+    slots = asyncio.Semaphore(TTS_ARTICLES)
+    tasks: set[asyncio.Task] = set()
+    while True:
+        await slots.acquire()
+        manuscript, task = await asyncio.to_thread(tts_queue.get)
+        t = asyncio.create_task(
+            tts_article(
+                manuscript, task, ledger, assembly_queue, article_scheduler, slots
+            )
+        )
+        tasks.add(t)
+        t.add_done_callback(tasks.discard)
 
-            if manuscript["state"] == "disallowed":
-                manuscript["lastmod"] = datetime.datetime.now()
-                insert_or_replace(manuscript)
-                queue.put((DISALLOWED_ID, scraping_url))
-                continue
-            elif manuscript["state"] == "error":
-                manuscript["lastmod"] = datetime.datetime.now()
-                insert_or_replace(manuscript)
-                queue.put((ERROR_ID, scraping_url))
-                continue
-
-            if existing_manuscript := COLLECTION.find_one({"_id": article_id}):
-                # ================= TMP =================
-                # existing_manuscript["sections"] = [
-                #     tmp_morph(s) for s in existing_manuscript["sections"]
-                # ]
-                # if (
-                #     "outro" in existing_manuscript
-                #     and "audio_path" in existing_manuscript["outro"]
-                # ):
-                #     del existing_manuscript["outro"]["audio_path"]
-                # if "complete_audio_path" in existing_manuscript:
-                #     del existing_manuscript["complete_audio_path"]
-                # insert_or_replace(existing_manuscript)
-                # ================= TMP =================
-
-                if manuscript["_id"] in ALWAYS_UPDATE:
-                    logger.warning(
-                        f'Article "{manuscript["title"]}" ({manuscript["_id"]}) in "always update", updating manuscript'
-                    )
-                    update_manuscript(manuscript)
-                elif (
-                    "state" in existing_manuscript
-                    and existing_manuscript["state"] == "generating"
-                ):
-                    logger.warning(
-                        f'Article "{manuscript["title"]}" ({manuscript["url"]}) interrupted during generation, re-generating manuscript'
-                    )
-                    update_manuscript(manuscript)
-                elif len(manuscript["sections"]) + 1 > len(list(audio_dir.iterdir())):
-                    logger.warning(
-                        f'Article "{manuscript["title"]}" ({manuscript["url"]}) has fewer generated files ({len(list(audio_dir.iterdir()))}) than needed ({len(manuscript["sections"]) + 1}), regenerating files'
+
+def assembly_stage(
+    assembly_queue: queue.Queue,
+    tts_queue: queue.Queue,
+    pool: concurrent.futures.ProcessPoolExecutor,
+    article_scheduler: scheduler.ArticleScheduler,
+) -> None:
+    while True:
+        article_id, allow_retry, job = assembly_queue.get()
+        start = time.monotonic()
+        try:
+            pool.submit(job, article_id).result()
+            logger.debug(f'Assembled "{article_id}" in {time.monotonic() - start:.2f}s')
+            record_stage(article_id, "assembly", start)
+        except Exception as e:
+            a = COLLECTION.find_one({"_id": article_id})
+            if allow_retry and a:
+                logger.error(
+                    f'Article "{a["title"]}" has breaking errors, force-updating manuscript - "{type(e)}: {e}"'
+                )
+                # The TTS stage may itself be waiting for room in the
+                # assembly queue, so never block on it from here
+                try:
+                    tts_queue.put_nowait((a, "Manuscript error"))
+                    continue
+                except queue.Full:
+                    # Regenerated from scratch when the scheduler hands it
+                    # out again
+                    COLLECTION.update_one(
+                        {"_id": article_id}, {"$set": {"state": "generating"}}
                     )
-                    update_manuscript(manuscript)
-                elif manuscript_changed(manuscript, existing_manuscript):
-                    if REFRESH_ARTICLES or manuscript["_id"] in ALWAYS_REFRESH:
-                        logger.info(
-                            f'Article "{manuscript["title"]}" ({manuscript["url"]}) changed, updating manuscript'
-                        )
-                        update_manuscript(manuscript)
-                    else:
-                        logger.warning(
-                            f'Article "{manuscript["title"]}" ({manuscript["url"]}) changed, but manuscript updating disabled - skipping'
-                        )
-                else:
-                    logger.info(
-                        f'Article "{manuscript["title"]}" ({manuscript["url"]}) unchanged, skipping'
+                    release_article(article_id, article_scheduler)
+                    article_scheduler.put(
+                        article_id,
+                        a.get("group", WIKI_URL),
+                        scheduler.PRIORITY_REFRESH,
                     )
-            else:
-                logger.info(
-                    f'Article "{manuscript["title"]}" ({manuscript["url"]}) not yet generated, generating manuscript'
+                    continue
+            logger.error(
+                f'Could not generate complete audio for "{article_id}" - "{type(e)}: {e}"'
+            )
+        release_article(article_id, article_scheduler)
+
+
+def collect_artifacts(referenced: set[pathlib.Path], grace: float) -> int:
+    """Remove files in the article audio directories that no manuscript
+    refers to any more, such as complete audio replaced by a regeneration,
+    once they are older than `grace` seconds."""
+    removed = 0
+    cutoff = time.time() - grace
+    for path in DB_DIR.glob(f"*/{AUDIO_DIR_NAME}/*"):
+        # Older articles keep their section audio in subdirectories
+        if path in referenced or not path.is_file():
+            continue
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def store_gc_stage() -> None:
+    while True:
+        time.sleep(STORE_GC_INTERVAL)
+        try:
+            referenced = {
+                url_to_path(url)
+                for manuscript in COLLECTION.find(
+                    {},
+                    {
+                        "sections.audio_url": 1,
+                        "sections.alignment_url": 1,
+                        "outro.audio_url": 1,
+                        "complete_audio_url": 1,
+                        "alignments_url": 1,
+                        "timeline_url": 1,
+                    },
                 )
-                update_manuscript(manuscript, "Generating manuscript")
+                for url in [
+                    *(
+                        section[key]
+                        for section in manuscript.get("sections", [])
+                        for key in ["audio_url", "alignment_url"]
+                        if key in section
+                    ),
+                    manuscript.get("outro", {}).get("audio_url"),
+                    manuscript.get("complete_audio_url"),
+                    manuscript.get("alignments_url"),
+                    manuscript.get("timeline_url"),
+                ]
+                if url
+            }
+            removed = STORE.collect_garbage(
+                {path.name.split(".")[0] for path in referenced}, STORE_GC_GRACE
+            )
+            removed += collect_artifacts(referenced, STORE_GC_GRACE)
+            logger.info(f"Garbage collection removed {removed} unreferenced files")
+        except Exception as e:
+            logger.exception(f"Garbage collection failed: {e}")
+
+
+def article_processor(article_scheduler: scheduler.ArticleScheduler) -> None:
+    article_scheduler.ensure_indexes()
+
+    tts_queue: queue.Queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    assembly_queue: queue.Queue = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    pool = concurrent.futures.ProcessPoolExecutor(
+        max_workers=ASSEMBLY_WORKERS, mp_context=multiprocessing.get_context("spawn")
+    )
+
+    threads = [
+        threading.Thread(
+            target=parse_stage,
+            args=(article_scheduler, tts_queue, assembly_queue),
+            name=f"parse-{i}",
+        )
+        for i in range(PARSER_WORKERS)
+    ]
+    threads += [
+        threading.Thread(
+            target=assembly_stage,
+            args=(assembly_queue, tts_queue, pool, article_scheduler),
+            name=f"assembly-{i}",
+        )
+        for i in range(ASSEMBLY_WORKERS)
+    ]
+    threads.append(threading.Thread(target=store_gc_stage, name="store-gc"))
+    for t in threads:
+        t.start()
+
+    asyncio.run(tts_stage(tts_queue, assembly_queue, article_scheduler))
+
+
+article_queue = scheduler.ArticleScheduler(QUEUE)
+web_queue = scheduler.AsyncArticleScheduler(ASYNC_DB["queue"])
+
+
+@dataclass
+class SitemapFile:
+    content: bytes
+    gzipped: bytes
+    etag: str
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "SitemapFile":
+        content = xml.encode()
+        return cls(
+            content,
+            gzip.compress(content, mtime=0),
+            f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        )
+
+    @property
+    def gzipped_etag(self) -> str:
+        # A distinct strong validator, since the gzipped body differs byte-wise
+        return f'{self.etag[:-1]}-gz"'
 
-        except httpx.ConnectError as e:
-            logger.warning(f'Could not GET article "{article_id}": {e}')
 
+# Sitemaps are rebuilt when META.lastmodified moves on; sitemap_files[0] is
+# /sitemap.xml, the rest are /sitemap-{n}.xml when the catalog is sharded
+sitemap_lastmodified: datetime.datetime | None = None
+sitemap_files: list[SitemapFile] = []
+sitemap_lock = asyncio.Lock()
+
+
+async def get_sitemaps() -> tuple[list[SitemapFile], datetime.datetime | None]:
+    global sitemap_lastmodified
+    global sitemap_files
+
+    meta = await ASYNC_META.find_one({"_id": "meta"}, {"lastmodified": 1})
+    lastmodified = meta.get("lastmodified") if meta else None
+    async with sitemap_lock:
         if (
-            (a := COLLECTION.find_one({"_id": article_id}))
-            and isinstance(a, dict)
-            and (
-                "complete_audio_url" not in a
-                or "transcript" not in a
-                or not url_to_path(a["complete_audio_url"]).exists()
-            )
+            not sitemap_files
+            or lastmodified is None
+            or (lastmodified != sitemap_lastmodified)
         ):
-            try:
-                generate_complete_audio(a["_id"])
-            except Exception as e:
-                logger.error(
-                    f'Article "{a["title"]}" has breaking errors, force-updating manuscript - "{type(e)}: {e}"'
+            manuscripts = (
+                await ASYNC_COLLECTION.find(
+                    {"state": "done", "lastmod": {"$exists": True}},
+                    {"state": 1, "lastmod": 1, "created": 1},
                 )
-                update_manuscript(a, "Manuscript error")
-                generate_complete_audio(a["_id"])
+                .sort("_id", pymongo.ASCENDING)
+                .to_list()
+            )
+            sitemap_files = await asyncio.to_thread(build_sitemaps, manuscripts)
+            sitemap_lastmodified = lastmodified
+            logger.info(
+                f"Built sitemap of {len(manuscripts)} articles in {len(sitemap_files)} file(s)"
+            )
+    return sitemap_files, sitemap_lastmodified
+
+
+def sitemap_response(
+    request: fastapi.Request,
+    sitemap: SitemapFile,
+    lastmodified: datetime.datetime | None,
+) -> fastapi.Response:
+    gzipped = "gzip" in request.headers.get("accept-encoding", "")
+    etag = sitemap.gzipped_etag if gzipped else sitemap.etag
+    headers = {**cache_headers(etag, lastmodified), "Vary": "Accept-Encoding"}
+    if not_modified(request.headers, etag, lastmodified):
+        return fastapi.Response(
+            status_code=http.HTTPStatus.NOT_MODIFIED, headers=headers
+        )
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return fastapi.Response(
+            content=sitemap.gzipped, media_type="application/xml", headers=headers
+        )
+    return fastapi.Response(
+        content=sitemap.content, media_type="application/xml", headers=headers
+    )
 
 
-article_queue: multiprocessing.Queue = multiprocessing.Queue()
-multiprocessing.Process(target=article_processor, args=(article_queue,)).start()
+@APP.get("/sitemap.xml")
+async def sitemap(request: fastapi.Request) -> fastapi.Response:
+    sitemaps, lastmodified = await get_sitemaps()
+    return sitemap_response(request, sitemaps[0], lastmodified)
 
 
-@APP.get("/sitemap.xml")
-def sitemap() -> fastapi.Response:
-    sitemap = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    for manuscript in tqdm.tqdm(
-        list(sorted(COLLECTION.find(), key=lambda a: a["_id"])),
-        desc="Building sitemap.xml",
-    ):
+@APP.get("/sitemap-{number}.xml")
+async def sitemap_shard(request: fastapi.Request, number: int) -> fastapi.Response:
+    sitemaps, lastmodified = await get_sitemaps()
+    if not 1 <= number < len(sitemaps):
+        raise fastapi.HTTPException(status_code=http.HTTPStatus.NOT_FOUND)
+    return sitemap_response(request, sitemaps[number], lastmodified)
+
+
+def build_sitemaps(manuscripts: list[dict]) -> list[SitemapFile]:
+    if len(manuscripts) <= SITEMAP_MAX_URLS:
+        return [SitemapFile.from_xml(build_sitemap(manuscripts))]
+
+    shards = [
+        manuscripts[i : i + SITEMAP_MAX_URLS]
+        for i in range(0, len(manuscripts), SITEMAP_MAX_URLS)
+    ]
+    return [SitemapFile.from_xml(build_sitemap_index(shards))] + [
+        SitemapFile.from_xml(build_sitemap(shard)) for shard in shards
+    ]
+
+
+def build_sitemap_index(shards: list[list[dict]]) -> str:
+    sitemap = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    ]
+    for i, shard in enumerate(shards, 1):
+        lastmod = max(m["lastmod"] for m in shard)
+        sitemap.append(
+            f"\n	<sitemap>"
+            f"\n		<loc>{SITE_URL}/sitemap-{i}.xml</loc>"
+            f"\n		<lastmod>{lastmod.date().isoformat()}</lastmod>"
+            "\n	</sitemap>\n"
+        )
+    sitemap.append("\n</sitemapindex>\n")
+    return "".join(sitemap)
+
+
+def build_sitemap(manuscripts: typing.Iterable[dict]) -> str:
+    sitemap = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    ]
+    for manuscript in manuscripts:
         if manuscript["state"] == "done" and "lastmod" in manuscript:
-            sitemap += "\n	<url>"
-            sitemap += f"\n		<loc>https://www.pprofounddecisions.co.uk/{"empire-wiki/" if manuscript["_id"] else ""}{urllib.parse.quote_plus(manuscript["_id"])}</loc>"
-            sitemap += (
+            sitemap.append("\n	<url>")
+            sitemap.append(
+                f"\n		<loc>{SITE_URL}/{"empire-wiki/" if manuscript["_id"] else ""}{urllib.parse.quote_plus(manuscript["_id"])}</loc>"
+            )
+            sitemap.append(
                 f"\n		<lastmod>{manuscript["lastmod"].date().isoformat()}</lastmod>"
             )
             if "created" in manuscript:
-                sitemap += (
+                sitemap.append(
                     f"\n		<created>{manuscript["created"].date().isoformat()}</created>"
                 )
-            sitemap += f"\n		<changefreq>monthly</changefreq>"
-            sitemap += "\n	</url>"
-            sitemap += "\n"
-    sitemap += "\n</urlset>"
-    sitemap += "\n"
-
-    return fastapi.Response(content=sitemap, media_type="application/xml")
+            sitemap.append("\n		<changefreq>monthly</changefreq>")
+            sitemap.append("\n	</url>\n")
+    sitemap.append("\n</urlset>\n")
+    return "".join(sitemap)
 
 
 # @app.get("/")
@@ -1221,16 +2115,76 @@ def sitemap() -> fastapi.Response:
 #     return starlette.responses.FileResponse(WEB_DIR / "index.html")
 
 
+def manuscript_modified(manuscript: dict) -> datetime.datetime | None:
+    modified = manuscript.get("modified") or manuscript.get("lastmod")
+    if modified and modified.tzinfo is None:
+        modified = modified.replace(tzinfo=datetime.UTC)
+    return typing.cast(datetime.datetime | None, modified)
+
+
+def manuscript_etag(manuscript: dict, *variant: object) -> str:
+    """Strong validator for one representation of a manuscript. Every write
+    to a manuscript sets "modified"; older documents fall back to the wiki
+    revision time."""
+    key = (
+        manuscript["_id"],
+        manuscript.get("state"),
+        manuscript.get("modified") or manuscript.get("lastmod"),
+        *variant,
+    )
+    return f'"{hashlib.sha256(repr(key).encode()).hexdigest()[:32]}"'
+
+
+async def queue_article(
+    article_id: str, scraping_url: str, manuscript: dict | None, cost: int
+) -> None:
+    await web_queue.put(
+        article_id,
+        scraping_url,
+        (
+            scheduler.PRIORITY_NEW
+            if manuscript is None or manuscript["state"] == "generating"
+            else scheduler.PRIORITY_REFRESH
+        ),
+        cost,
+    )
+
+
 @APP.get("/api/manuscript/{article_id:path}")
-def manuscript(article_id: str, scraping_url: str = WIKI_URL) -> typing.Any:
+async def manuscript(
+    request: fastapi.Request,
+    response: fastapi.Response,
+    article_id: str,
+    scraping_url: str = WIKI_URL,
+) -> typing.Any:
     article_id = article_id.split("#")[0].split("/")[-1]
 
-    manuscript = get_article(article_id)
-    article_queue.put((article_id, scraping_url))
+    validators = await get_article(article_id, VALIDATOR_FIELDS)
+    if validators and "cost" in validators:
+        etag = manuscript_etag(validators, "json")
+        modified = manuscript_modified(validators)
+        if not_modified(request.headers, etag, modified):
+            await queue_article(
+                article_id, scraping_url, validators, validators["cost"]
+            )
+            return fastapi.Response(
+                status_code=http.HTTPStatus.NOT_MODIFIED,
+                headers=cache_headers(etag, modified),
+            )
+
+    manuscript = await get_article(article_id, WITHOUT_TRANSCRIPT)
+    await queue_article(
+        article_id, scraping_url, manuscript, manuscript_cost(manuscript)
+    )
     if manuscript is not None:
+        response.headers.update(
+            cache_headers(
+                manuscript_etag(manuscript, "json"), manuscript_modified(manuscript)
+            )
+        )
         return manuscript
     else:
-        insert_or_replace(
+        await insert_or_replace_async(
             {
                 "_id": article_id,
                 "progress": 0.0,
@@ -1292,32 +2246,38 @@ def manuscript(article_id: str, scraping_url: str = WIKI_URL) -> typing.Any:
         }
 
 
+@APP.get("/api/queue/{article_id:path}")
+async def queue_position(article_id: str) -> dict:
+    article_id = article_id.split("#")[0].split("/")[-1]
+    return {
+        "position": await web_queue.position(article_id),
+        "depth": await web_queue.qsize(),
+    }
+
+
 @APP.get("/api/complete_audio/{article_id:path}")
-def complete_audio(article_id: str) -> str:
-    manuscript = get_article(article_id)
+async def complete_audio(article_id: str) -> str:
+    manuscript = await get_article(article_id, {"state": 1, "complete_audio_url": 1})
     if not isinstance(manuscript, dict) or manuscript["state"] != "done":
         raise Exception("Article not generated")
-    if (
-        "complete_audio_url" not in manuscript
-        or not url_to_path(manuscript["complete_audio_url"]).exists()
+    if "complete_audio_url" not in manuscript or not await asyncio.to_thread(
+        url_to_path(manuscript["complete_audio_url"]).exists
     ):
-        generate_complete_audio(article_id)
+        await asyncio.to_thread(generate_complete_audio, article_id)
 
-    manuscript = get_article(article_id)
+    manuscript = await get_article(article_id, {"complete_audio_url": 1})
     assert isinstance(manuscript, dict)
     return str(manuscript["complete_audio_url"])
 
 
 APP.mount(
     "/static/",
-    fastapi.staticfiles.StaticFiles(directory=WEB_DIR, html=True),
+    static.CachedStaticFiles(directory=WEB_DIR, html=True),
     name="Web",
 )
 
 
-APP.mount(
-    "/db/", fastapi.staticfiles.StaticFiles(directory=DB_DIR, html=True), name="DB"
-)
+APP.mount("/db/", static.CachedStaticFiles(directory=DB_DIR, html=True), name="DB")
 
 
 class EndpointFilter(logging.Filter):
@@ -1330,55 +2290,40 @@ logging.getLogger("uvicorn.access").addFilter(EndpointFilter())
 
 
 @APP.get("/robots.txt")
-def robots() -> starlette.responses.FileResponse:
+async def robots() -> starlette.responses.FileResponse:
     return starlette.responses.FileResponse(WEB_DIR / "robots.txt")
 
 
 @APP.get("/favicon.ico")
-def favicon() -> starlette.responses.FileResponse:
+async def favicon() -> starlette.responses.FileResponse:
     return starlette.responses.FileResponse(WEB_DIR / "favicon.ico")
 
 
-@APP.get("/{article_id:path}")
-def index(article_id: str) -> fastapi.responses.HTMLResponse:
-    article_id = article_id.split("#")[0].split("/")[-1]
-
-    with open(WEB_DIR / "index.html") as f:
-        index = f.read()
-    article = get_article(article_id)
-    if article:
-        if "title" in article and article["title"]:
-            index = index.replace(
-                "Empire Wikipedia Winds of Speech",
-                f"Empire Wikipedia Winds of Speech - {article["title"]}",
-            )
-        if "img" in article and article["img"]:
-            index = index.replace(
-                "https://www.pprofounddecisions.co.uk/meta.png", article["img"]
-            )
+def render_index(article: dict | None) -> str:
+    if not article:
+        return INDEX_TEMPLATE.render({})
 
-        replaced_meta = False
-        article_content = ""
-        if "sections" in article and article["sections"]:
-            for i, section in enumerate(article["sections"]):
-                article_content += f'<{section["section_type"]}>'
-                section_content = " ".join(s["text"] for s in section["spans"])
-                article_content += section_content
-                article_content += f"</{section["section_type"]}>"
-                if not replaced_meta and section["section_type"] == "p":
-                    index = index.replace(
-                        "An unofficial text-to-speech system for the Empire Wikipedia.",
-                        f"{section_content}\n\nBrought to you by: Empire Wikipedia Winds of Speech - An unofficial text-to-speech system for the Empire Wikipedia. ",
-                    )
-                    replaced_meta = True
+    values = {}
+    if "title" in article and article["title"]:
+        values[page.TITLE] = f"{page.TITLE} - {article["title"]}"
+    if "img" in article and article["img"]:
+        values[page.IMAGE] = article["img"]
 
-            index = (
-                index.split('article-content">', 1)[0]
-                + f'article-content">{article_content}'
-                + index.split('article-content">', 1)[1]
+    article_content = []
+    for section in article.get("sections") or []:
+        section_content = " ".join(s["text"] for s in section["spans"])
+        article_content.append(
+            f"<{section["section_type"]}>{section_content}</{section["section_type"]}>"
+        )
+        if page.DESCRIPTION not in values and section["section_type"] == "p":
+            values[page.DESCRIPTION] = (
+                f"{section_content}\n\nBrought to you by: {page.TITLE} - {page.DESCRIPTION} "
             )
+    return INDEX_TEMPLATE.render(values, "".join(article_content))
+
 
-    status_code = (
+def article_status(article: dict | None) -> int:
+    return (
         HTTP_LOOKUP[article["_id"]]
         if article and article["_id"] in HTTP_LOOKUP
         else (
@@ -1387,4 +2332,41 @@ def index(article_id: str) -> fastapi.responses.HTMLResponse:
             else 404
         )
     )
-    return fastapi.responses.HTMLResponse(content=index, status_code=status_code)
+
+
+@APP.get("/{article_id:path}")
+async def index(request: fastapi.Request, article_id: str) -> fastapi.Response:
+    article_id = article_id.split("#")[0].split("/")[-1]
+
+    article = await get_article(article_id, VALIDATOR_FIELDS)
+    status_code = article_status(article)
+    if not article:
+        return fastapi.responses.HTMLResponse(
+            content=render_index(None), status_code=status_code
+        )
+
+    template_version = INDEX_TEMPLATE.load()
+    etag = manuscript_etag(article, "html", template_version)
+    modified = max(
+        filter(
+            None,
+            [
+                manuscript_modified(article),
+                datetime.datetime.fromtimestamp(template_version / 1e9, datetime.UTC),
+            ],
+        )
+    )
+    # Only successful responses are cacheable and can be answered with 304
+    headers = cache_headers(etag, modified) if status_code == http.HTTPStatus.OK else {}
+    if headers and not_modified(request.headers, etag, modified):
+        return fastapi.Response(
+            status_code=http.HTTPStatus.NOT_MODIFIED, headers=headers
+        )
+
+    content = INDEX_CACHE.get(article["_id"], etag)
+    if content is None:
+        content = render_index(await get_article(article_id, RENDER_FIELDS))
+        INDEX_CACHE.put(article["_id"], etag, content)
+    return fastapi.responses.HTMLResponse(
+        content=content, status_code=status_code, headers=headers
+    )
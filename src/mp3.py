@@ -0,0 +1,163 @@
+import pathlib
+import typing
+
+# Bitrates in kbps indexed by the header's bitrate index, for Layer III.
+BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {
+    1: [44_100, 48_000, 32_000],
+    2: [22_050, 24_000, 16_000],
+    25: [11_025, 12_000, 8_000],
+}
+VERSIONS = {0b11: 1, 0b10: 2, 0b00: 25}
+LAYER_III = 0b01
+CHANNEL_MODE_MONO = 0b11
+
+
+class FrameHeader(typing.NamedTuple):
+    raw: bytes
+    version: int
+    protected: bool
+    bitrate: int
+    sample_rate: int
+    padding: int
+    channel_mode: int
+
+    @property
+    def samples(self) -> int:
+        return 1152 if self.version == 1 else 576
+
+    @property
+    def length(self) -> int:
+        return (self.samples // 8) * self.bitrate // self.sample_rate + self.padding
+
+    @property
+    def side_info_length(self) -> int:
+        mono = self.channel_mode == CHANNEL_MODE_MONO
+        if self.version == 1:
+            return 17 if mono else 32
+        return 9 if mono else 17
+
+    @property
+    def format(self) -> tuple[int, int, int]:
+        return self.version, self.sample_rate, self.channel_mode
+
+
+def parse_header(data: bytes | memoryview, offset: int) -> FrameHeader | None:
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset : offset + 4]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version = VERSIONS.get((b1 >> 3) & 0b11)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0b11
+    if (
+        version is None
+        or (b1 >> 1) & 0b11 != LAYER_III
+        or bitrate_index in (0, 0b1111)
+        or sample_rate_index == 0b11
+    ):
+        return None
+    return FrameHeader(
+        raw=bytes(data[offset : offset + 4]),
+        version=version,
+        protected=not b1 & 1,
+        bitrate=BITRATES[min(version, 2)][bitrate_index] * 1000,
+        sample_rate=SAMPLE_RATES[version][sample_rate_index],
+        padding=(b2 >> 1) & 1,
+        channel_mode=b3 >> 6,
+    )
+
+
+def id3v2_length(data: bytes | memoryview) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for b in data[6:10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(header: FrameHeader, frame: memoryview) -> bool:
+    offset = 4 + (2 if header.protected else 0) + header.side_info_length
+    return bytes(frame[offset : offset + 4]) in (b"Xing", b"Info") or (
+        bytes(frame[36:40]) == b"VBRI"
+    )
+
+
+def iter_frames(data: bytes) -> typing.Iterator[tuple[FrameHeader, memoryview]]:
+    """Yield the audio frames of an MP3 file, skipping ID3v1/v2 tags, the
+    Xing/Info/VBRI header frame and any junk between frames."""
+    view = memoryview(data)
+    end = len(view) - 128 if view[-128:-125] == b"TAG" else len(view)
+    offset = id3v2_length(view)
+    first = True
+    while offset < end:
+        header = parse_header(view, offset)
+        if not header or offset + header.length > end:
+            offset += 1
+            continue
+        frame = view[offset : offset + header.length]
+        offset += header.length
+        if first:
+            first = False
+            if is_info_frame(header, frame):
+                continue
+        yield header, frame
+
+
+def silent_frame(header: FrameHeader) -> bytes:
+    """A frame in the format of `header` whose side info is all zero, i.e. no
+    main data and no bit reservoir use, which decodes to silence."""
+    raw = bytearray(header.raw)
+    raw[1] |= 1  # no CRC
+    raw[2] &= ~0b10 & 0xFF  # no padding
+    silent = header._replace(raw=bytes(raw), protected=False, padding=0)
+    return silent.raw + bytes(silent.length - 4)
+
+
+class Mp3Writer:
+    """Concatenate MP3 files frame by frame into `f`, without decoding.
+
+    All appended files must share one MPEG version, sample rate and channel
+    mode; bitrates may differ. Silence is written as empty frames in the
+    format of the first appended file, and the running length is counted in
+    frames so that timestamps are exact."""
+
+    def __init__(self, f: typing.BinaryIO):
+        self.f = f
+        self.format: tuple[int, int, int] | None = None
+        self.sample_rate = 0
+        self.samples = 0
+        self.silence: bytes = b""
+
+    @property
+    def seconds(self) -> float:
+        return self.samples / self.sample_rate if self.sample_rate else 0
+
+    def append(self, path: pathlib.Path) -> None:
+        with open(path, "rb") as f:
+            data = f.read()
+        for header, frame in iter_frames(data):
+            if self.format is None:
+                self.format = header.format
+                self.sample_rate = header.sample_rate
+                self.silence = silent_frame(header)
+            elif header.format != self.format:
+                raise ValueError(
+                    f'"{path}" is {header.format}, expected {self.format} (version, sample rate, channel mode)'
+                )
+            self.f.write(frame)
+            self.samples += header.samples
+
+    def append_silence(self, seconds: float) -> None:
+        if self.format is None:
+            raise ValueError("Cannot write silence before the first audio frame")
+        samples_per_frame = 1152 if self.format[0] == 1 else 576
+        frames = round(seconds * self.sample_rate / samples_per_frame)
+        self.f.write(self.silence * frames)
+        self.samples += frames * samples_per_frame
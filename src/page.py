@@ -0,0 +1,76 @@
+import collections
+import os
+import pathlib
+import typing
+
+import regex
+
+TITLE = "Empire Wikipedia Winds of Speech"
+DESCRIPTION = "An unofficial text-to-speech system for the Empire Wikipedia."
+IMAGE = "https://www.pprofounddecisions.co.uk/meta.png"
+CONTENT = 'article-content">'
+
+SLOTS = regex.compile(
+    "(" + "|".join(regex.escape(s) for s in [TITLE, DESCRIPTION, IMAGE, CONTENT]) + ")"
+)
+
+
+class Template:
+    """index.html split once at the strings that are filled in per article.
+
+    Every occurrence of TITLE, DESCRIPTION and IMAGE is replaced by the value
+    given for it, and the article content is inserted after the first
+    CONTENT. The file is read again when its modification time changes.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.version: int | None = None
+        self.parts: list[str] = []
+
+    def load(self) -> int:
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.version:
+            self.parts = SLOTS.split(self.path.read_text())
+            self.version = mtime
+        return mtime
+
+    def render(self, values: dict[str, str], content: str = "") -> str:
+        self.load()
+        out = []
+        inserted = False
+        for i, part in enumerate(self.parts):
+            if i % 2 == 0:
+                out.append(part)
+            elif part == CONTENT:
+                out.append(part if inserted else part + content)
+                inserted = True
+            else:
+                out.append(values.get(part, part))
+        return "".join(out)
+
+
+class PageCache:
+    """Rendered pages by article, evicting the least recently used.
+
+    Each entry remembers the version it was rendered for, so a changed
+    article replaces its own entry instead of adding another."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.pages: collections.OrderedDict[str, tuple[typing.Hashable, typing.Any]] = (
+            collections.OrderedDict()
+        )
+
+    def get(self, key: str, version: typing.Hashable) -> typing.Any:
+        entry = self.pages.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        self.pages.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, version: typing.Hashable, page: typing.Any) -> None:
+        self.pages[key] = (version, page)
+        self.pages.move_to_end(key)
+        while len(self.pages) > self.maxsize:
+            self.pages.popitem(last=False)
@@ -1,3 +1,5 @@
+import asyncio
+import contextlib
 import datetime
 import json
 import os
@@ -7,16 +9,17 @@ import typing
 import fastapi
 import fastapi.staticfiles
 import loguru
-import markdownify
 import mutagen
-import mutagen.easyid3
-import mutagen.id3
 import mutagen.mp3
 import pod2gen
 import pymongo
-import tqdm
 
-from .utils import url_to_path
+from .utils import (
+    CATEGORY_COLLATION,
+    MANUSCRIPT_INDEXES,
+    episode_summaries,
+    url_to_path,
+)
 
 WEB_DIR = pathlib.Path(os.environ["WEB_DIR"])
 
@@ -41,44 +44,84 @@ CHAPTER_SEGMENT_TYPE = os.environ["CHAPTER_SEGMENT_TYPE"]
 METADATA_DIR = pathlib.Path("metadata")
 METADATA_DIR.mkdir(parents=True, exist_ok=True)
 
-app = fastapi.FastAPI()
-mongodb_client: pymongo.MongoClient = pymongo.MongoClient(MONGODB_DOMAIN, 27017)
+
+@contextlib.asynccontextmanager
+async def lifespan(app: fastapi.FastAPI) -> typing.AsyncIterator[None]:
+    await COLLECTION.create_indexes(MANUSCRIPT_INDEXES)
+    yield
+    await mongodb_client.close()
+
+
+app = fastapi.FastAPI(lifespan=lifespan)
+mongodb_client: pymongo.AsyncMongoClient = pymongo.AsyncMongoClient(
+    MONGODB_DOMAIN, 27017
+)
 DB = mongodb_client["database"]
 COLLECTION = DB["manuscripts"]
 META = DB["meta"]
 
+EPISODES_FILTER: dict[str, typing.Any] = {
+    "state": "done",
+    "complete_audio_url": {"$exists": True},
+    "$or": [{"group": {"$exists": False}}, {"group": MANUSCRIPT_FILTER_GROUP}],
+}
+if MANUSCRIPT_FILTER_CATEGORY:
+    EPISODES_FILTER["categories"] = MANUSCRIPT_FILTER_CATEGORY
+EPISODE_FIELDS = {
+    "title": 1,
+    "complete_audio_url": 1,
+    "episode": 1,
+    "categories": 1,
+    "img": 1,
+    "created": 1,
+    "lastmod": 1,
+    "modified": 1,
+}
+# Manuscripts generated before the episode metadata was stored need their
+# sections for the summaries
+SECTION_FIELDS = {"sections.section_type": 1, "sections.spans.text": 1}
+# An episode is rebuilt when one of these changes
+VERSION_FIELDS = {"modified": 1, "complete_audio_url": 1}
+TRANSCRIPT_FIELDS = {
+    "title": 1,
+    "transcript": 1,
+    "complete_audio_url": 1,
+    "episode.duration": 1,
+}
+
+
+def manuscript_version(manuscript: dict) -> tuple:
+    return manuscript.get("modified"), manuscript["complete_audio_url"]
+
+
+def episode_metadata(manuscript: dict) -> dict:
+    """Size, duration and summaries of the episode, as stored by the generator
+    with the complete audio, or worked out from the audio file and sections
+    for manuscripts generated before it stored them."""
+    if "episode" in manuscript:
+        return dict(manuscript["episode"])
+    audio_file = url_to_path(manuscript["complete_audio_url"])
+    summary, long_summary = episode_summaries(manuscript)
+    return {
+        "size": os.stat(audio_file).st_size,
+        "duration": mutagen.File(audio_file).info.length,
+        "summary": summary,
+        "long_summary": long_summary,
+    }
+
 
 def get_episode(manuscript: dict) -> typing.Any:
     manuscript_id = manuscript["_id"].replace("?", "%3F")
     try:
+        metadata = episode_metadata(manuscript)
         return pod2gen.Episode(
             title=manuscript["title"],
-            summary=pod2gen.htmlencode(
-                next(
-                    (
-                        " ".join(span["text"] for span in section["spans"]).strip()
-                        for section in manuscript["sections"]
-                        if section["section_type"] == "p"
-                    ),
-                    "",
-                )
-            ),
-            long_summary=pod2gen.htmlencode(
-                markdownify.markdownify(
-                    "".join(
-                        f"<{section["section_type"]}>{" ".join(span["text"] for span in section["spans"]).strip()}</{section["section_type"]}>"
-                        for section in manuscript["sections"]
-                    )
-                )
-            ),
+            summary=pod2gen.htmlencode(metadata["summary"]),
+            long_summary=pod2gen.htmlencode(metadata["long_summary"]),
             media=pod2gen.Media(
                 f"{EPISODE_URL}/audio/{manuscript_id}.mp3",
-                size=os.stat(url_to_path(manuscript["complete_audio_url"])).st_size,
-                duration=datetime.timedelta(
-                    seconds=mutagen.File(
-                        url_to_path(manuscript["complete_audio_url"])
-                    ).info.length
-                ),
+                size=metadata["size"],
+                duration=datetime.timedelta(seconds=metadata["duration"]),
             ),
             persons=PERSONS,
             authors=PERSONS,
@@ -113,62 +156,116 @@ def get_episode(manuscript: dict) -> typing.Any:
         return None
 
 
+def build_podcast(episodes: list[typing.Any]) -> str:
+    _podcast = pod2gen.Podcast(
+        name=NAME,
+        description=DESCRIPTION,
+        persons=PERSONS,
+        authors=PERSONS,
+        owner=OWNER,
+        category=CATEGORY,
+        website=WEB,
+        image=ART,
+        explicit=True,
+        language=LANGUAGE,
+        feed_url=URL,
+    )
+    _podcast.episodes = episodes
+    return str(_podcast.rss_str())
+
+
 lastmodified = datetime.datetime.min
 podcast = None
+podcast_lock = asyncio.Lock()
+# Episodes by manuscript id, with the version of the manuscript they were
+# built from. None for manuscripts whose episode could not be built.
+episodes: dict[str, tuple[tuple, typing.Any]] = {}
+
+
+async def episode_manuscripts(article_ids: list[str]) -> list[dict]:
+    manuscripts = (
+        await COLLECTION.find(
+            {**EPISODES_FILTER, "_id": {"$in": article_ids}},
+            EPISODE_FIELDS,
+            collation=CATEGORY_COLLATION if MANUSCRIPT_FILTER_CATEGORY else None,
+        )
+        .sort("_id", pymongo.ASCENDING)
+        .to_list()
+    )
+    legacy = [m["_id"] for m in manuscripts if "episode" not in m]
+    if legacy:
+        sections = {
+            m["_id"]: m.get("sections", [])
+            async for m in COLLECTION.find({"_id": {"$in": legacy}}, SECTION_FIELDS)
+        }
+        for manuscript in manuscripts:
+            if manuscript["_id"] in sections:
+                manuscript["sections"] = sections[manuscript["_id"]]
+    return manuscripts
+
+
+def get_episodes(manuscripts: list[dict]) -> list[typing.Any]:
+    return [get_episode(manuscript) for manuscript in manuscripts]
+
+
+async def update_episodes() -> list[typing.Any]:
+    """Rebuild the episodes of manuscripts that changed since they were last
+    built, drop those no longer in the feed, and return the episodes in feed
+    order."""
+    versions = {
+        m["_id"]: manuscript_version(m)
+        async for m in COLLECTION.find(
+            EPISODES_FILTER,
+            VERSION_FIELDS,
+            collation=CATEGORY_COLLATION if MANUSCRIPT_FILTER_CATEGORY else None,
+        ).sort("_id", pymongo.ASCENDING)
+    }
+    for article_id in episodes.keys() - versions.keys():
+        del episodes[article_id]
+
+    changed = [
+        article_id
+        for article_id, version in versions.items()
+        if article_id not in episodes or episodes[article_id][0] != version
+    ]
+    if changed:
+        loguru.logger.info(f"Building {len(changed)} of {len(versions)} episodes")
+        for article_id in changed:
+            episodes.pop(article_id, None)
+        manuscripts = await episode_manuscripts(changed)
+        # Manuscripts generated before the episode metadata was stored have
+        # their audio file read, keep it off the event loop
+        for manuscript, episode in zip(
+            manuscripts, await asyncio.to_thread(get_episodes, manuscripts)
+        ):
+            episodes[manuscript["_id"]] = (manuscript_version(manuscript), episode)
+
+    return [
+        episodes[article_id][1]
+        for article_id in versions
+        if article_id in episodes and episodes[article_id][1]
+    ]
 
 
 @app.head("/")
 @app.get("/")
-def index() -> fastapi.Response:
+async def index() -> fastapi.Response:
     global lastmodified
     global podcast
 
-    meta = META.find_one({"_id": "meta"})
+    meta = await META.find_one({"_id": "meta"})
     if meta:
         _lastmodified = meta["lastmodified"]
         if isinstance(_lastmodified, datetime.datetime):
-            if _lastmodified > lastmodified:
-                loguru.logger.info(
-                    f"Manuscript updated ({_lastmodified} > {lastmodified}) - regenerating podcast"
-                )
-                lastmodified = _lastmodified
-                manuscripts = list(COLLECTION.find())
-                _podcast = pod2gen.Podcast(
-                    name=NAME,
-                    description=DESCRIPTION,
-                    persons=PERSONS,
-                    authors=PERSONS,
-                    owner=OWNER,
-                    category=CATEGORY,
-                    website=WEB,
-                    image=ART,
-                    explicit=True,
-                    language=LANGUAGE,
-                    feed_url=URL,
-                )
-                _podcast.episodes += [
-                    get_episode(manuscript)
-                    for manuscript in tqdm.tqdm(
-                        sorted(manuscripts, key=lambda a: a["_id"]),
-                        total=len(manuscripts),
+            async with podcast_lock:
+                if _lastmodified > lastmodified:
+                    loguru.logger.info(
+                        f"Manuscript updated ({_lastmodified} > {lastmodified}) - regenerating podcast"
                     )
-                    if manuscript["state"] == "done"
-                    and "complete_audio_url" in manuscript
-                    and (
-                        "group" not in manuscript
-                        or manuscript["group"] == MANUSCRIPT_FILTER_GROUP
+                    podcast = await asyncio.to_thread(
+                        build_podcast, await update_episodes()
                     )
-                    and (
-                        not MANUSCRIPT_FILTER_CATEGORY
-                        or (
-                            "categories" in manuscript
-                            and MANUSCRIPT_FILTER_CATEGORY.lower()
-                            in [c.lower() for c in manuscript["categories"]]
-                        )
-                    )
-                ]
-                _podcast.episodes = [e for e in _podcast.episodes if e]
-                podcast = _podcast.rss_str()
+                    lastmodified = _lastmodified
         else:
             loguru.logger.error(
                 f'Meta "lastmodified" have incorrect correct type, got {type(_lastmodified)} expected {datetime.datetime}. Cannot update smartly...'
@@ -253,8 +350,8 @@ def range_requests_response(
     )
 
 
-def get_manuscript(episode_id: str) -> typing.Any:
-    manuscript = COLLECTION.find_one({"_id": episode_id})
+async def get_manuscript(episode_id: str) -> typing.Any:
+    manuscript = await COLLECTION.find_one({"_id": episode_id}, TRANSCRIPT_FIELDS)
     if not manuscript:
         raise fastapi.HTTPException(
             detail=f'Episode "{episode_id}" does not exist',
@@ -270,64 +367,40 @@ def get_manuscript(episode_id: str) -> typing.Any:
     return manuscript
 
 
-@app.head("/audio/{episode_id}.mp3")
-@app.get("/audio/{episode_id}.mp3")
-def audio(req: fastapi.Request, episode_id: str) -> fastapi.Response:
-    manuscript = get_manuscript(episode_id)
+def audio_length(manuscript: dict) -> float:
+    if "episode" in manuscript:
+        return float(manuscript["episode"]["duration"])
+    return float(
+        mutagen.File(url_to_path(manuscript["complete_audio_url"])).info.length
+    )
 
-    audio_file = url_to_path(manuscript["complete_audio_url"])
 
-    try:
-        easyid_file = mutagen.easyid3.EasyID3(audio_file)
-        easyid_file["title"] = manuscript["title"]
-        easyid_file["album"] = NAME
-        easyid_file["artist"] = ",".join([p.name for p in PERSONS])
-        easyid_file.save()
-
-        id3_file = mutagen.id3.ID3(audio_file)
-        chapters = [
-            c for c in manuscript["transcript"] if c["type"] == CHAPTER_SEGMENT_TYPE
-        ]
-        id3_file.add(
-            mutagen.id3.CTOC(
-                element_id="toc",
-                flags=mutagen.id3.CTOCFlags.TOP_LEVEL | mutagen.id3.CTOCFlags.ORDERED,
-                child_element_ids=[c["body"] for c in chapters],
-                sub_frames=[
-                    mutagen.id3.TIT2(text=["TOC"]),
-                ],
-            )
+@app.head("/audio/{episode_id}.mp3")
+@app.get("/audio/{episode_id}.mp3")
+async def audio(req: fastapi.Request, episode_id: str) -> fastapi.Response:
+    manuscript = await COLLECTION.find_one(
+        {"_id": episode_id}, {"complete_audio_url": 1}
+    )
+    if not manuscript or "complete_audio_url" not in manuscript:
+        raise fastapi.HTTPException(
+            detail=f'Episode "{episode_id}" does not exist',
+            status_code=fastapi.status.HTTP_404_NOT_FOUND,
         )
 
-        for i, chapter in enumerate(chapters):
-            id3_file.add(
-                mutagen.id3.CHAP(
-                    element_id=chapter["body"],
-                    start_time=int(chapter["startTime"] * 1000),
-                    end_time=int(
-                        (
-                            chapters[i + 1]["startTime"]
-                            if i < len(chapters) - 1
-                            else mutagen.File(audio_file).info.length
-                        )
-                        * 1000
-                    ),
-                    sub_frames=[
-                        mutagen.id3.TIT2(text=[chapter["body"]]),
-                    ],
-                )
-            )
-        id3_file.save()
-    except UnicodeEncodeError as e:
-        loguru.logger.error(f'Could not encode "{episode_id}": {e}')
-
-    return range_requests_response(req, audio_file, "audio/mp3")
+    # The generator writes the ID3 tags and chapters with the audio
+    return await asyncio.to_thread(
+        range_requests_response,
+        req,
+        url_to_path(manuscript["complete_audio_url"]),
+        "audio/mp3",
+    )
 
 
 @app.head("/chapters_json/{episode_id}.json")
 @app.get("/chapters_json/{episode_id}.json")
-def chapters_json(episode_id: str) -> fastapi.Response:
-    manuscript = get_manuscript(episode_id)
+async def chapters_json(episode_id: str) -> fastapi.Response:
+    manuscript = await get_manuscript(episode_id)
+    length = await asyncio.to_thread(audio_length, manuscript)
 
     return fastapi.responses.JSONResponse(
         content={
@@ -341,9 +414,7 @@ def chapters_json(episode_id: str) -> fastapi.Response:
                         (
                             manuscript["transcript"][i + 1]["startTime"]
                             if i < len(s) - 1
-                            else mutagen.File(
-                                url_to_path(manuscript["complete_audio_url"])
-                            ).info.length
+                            else length
                         )
                         * 1000
                     ),
@@ -357,9 +428,10 @@ def chapters_json(episode_id: str) -> fastapi.Response:
 
 @app.head("/transcript/{episode_id}.json")
 @app.get("/transcript/{episode_id}.json")
-def transcript_json(episode_id: str) -> fastapi.Response:
+async def transcript_json(episode_id: str) -> fastapi.Response:
+    manuscript = await get_manuscript(episode_id)
     return fastapi.responses.JSONResponse(
-        content={"segments": get_manuscript(episode_id)["transcript"]}
+        content={"segments": manuscript["transcript"]}
     )
 
 
@@ -371,8 +443,9 @@ def srt_timestamp(t: datetime.time) -> str:
 
 @app.head("/transcript/{episode_id}.srt")
 @app.get("/transcript/{episode_id}.srt")
-def transcript_srt(episode_id: str) -> fastapi.Response:
-    manuscript = get_manuscript(episode_id)
+async def transcript_srt(episode_id: str) -> fastapi.Response:
+    manuscript = await get_manuscript(episode_id)
+    length = await asyncio.to_thread(audio_length, manuscript)
 
     srt = ""
     start_time = datetime.time()
@@ -381,7 +454,7 @@ def transcript_srt(episode_id: str) -> fastapi.Response:
         end_time = datetime.datetime.fromtimestamp(
             manuscript["transcript"][i + 1]["startTime"]
             if i < len(manuscript["transcript"]) - 1
-            else mutagen.File(url_to_path(manuscript["complete_audio_url"])).info.length
+            else length
         ).time()
         srt += f"""{i+1}
 {srt_timestamp (start_time)} --> {srt_timestamp(end_time)}
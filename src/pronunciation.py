@@ -0,0 +1,41 @@
+import functools
+import json
+import pathlib
+
+import regex
+
+
+class Pronunciation:
+    """Pronunciation rules compiled into a single case-insensitive pattern.
+
+    Each rule becomes a named alternative of one combined regex, and the name
+    of the alternative that matched indexes the replacement. Normalizing a
+    text is therefore one pass regardless of the number of rules. Where rules
+    overlap, the leftmost match wins, then the rule listed first.
+    Replacements are literal text.
+    """
+
+    def __init__(self, rules: list[tuple[str, str]], cache_size: int = 4096):
+        self.replacements = [t for _, t in rules]
+        self.pattern = (
+            regex.compile(
+                "|".join(f"(?P<r{i}>{f})" for i, (f, _) in enumerate(rules)),
+                regex.IGNORECASE,
+            )
+            if rules
+            else None
+        )
+        self.normalize = functools.lru_cache(maxsize=cache_size)(self._normalize)
+
+    @classmethod
+    def from_json(cls, path: pathlib.Path | str) -> "Pronunciation":
+        with open(path) as f:
+            return cls([(r["from"], r["to"]) for r in json.load(f)])
+
+    def _replace(self, m: regex.Match) -> str:
+        return self.replacements[int(str(m.lastgroup)[1:])]
+
+    def _normalize(self, text: str) -> str:
+        if self.pattern is None:
+            return text
+        return str(self.pattern.sub(self._replace, text))
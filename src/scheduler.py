@@ -0,0 +1,121 @@
+import datetime
+import time
+import typing
+
+import pymongo
+import pymongo.asynchronous.collection
+import pymongo.collection
+
+PRIORITY_NEW = 0
+PRIORITY_REFRESH = 1
+PRIORITY_BACKGROUND = 2
+
+QUEUE_ORDER = [
+    ("priority", pymongo.ASCENDING),
+    ("cost", pymongo.ASCENDING),
+    ("enqueued", pymongo.ASCENDING),
+]
+
+
+def queue_push_update(
+    scraping_url: str, priority: int, cost: int
+) -> dict[str, typing.Any]:
+    return {
+        "$min": {"priority": priority},
+        "$set": {"scraping_url": scraping_url, "cost": cost},
+        "$setOnInsert": {"enqueued": datetime.datetime.now(datetime.UTC)},
+    }
+
+
+def queue_ahead_filter(entry: dict) -> dict[str, typing.Any]:
+    return {
+        "$or": [
+            {"priority": {"$lt": entry["priority"]}},
+            {"priority": entry["priority"], "cost": {"$lt": entry["cost"]}},
+            {
+                "priority": entry["priority"],
+                "cost": entry["cost"],
+                "enqueued": {"$lt": entry["enqueued"]},
+            },
+        ]
+    }
+
+
+class ArticleScheduler:
+    """Coalescing priority queue of articles waiting to be processed.
+
+    Pending articles are stored as one document per article, so repeated
+    requests for the same article merge into a single entry that keeps the
+    most urgent priority it has been given. Entries are handed out by
+    priority, then estimated cost (character count), then arrival.
+    """
+
+    def __init__(
+        self, collection: pymongo.collection.Collection, poll_interval: float = 1
+    ):
+        self.collection = collection
+        self.poll_interval = poll_interval
+
+    def ensure_indexes(self) -> None:
+        self.collection.create_index(QUEUE_ORDER, name="queue_order")
+
+    def put(
+        self,
+        article_id: str,
+        scraping_url: str,
+        priority: int = PRIORITY_REFRESH,
+        cost: int = 0,
+    ) -> None:
+        self.collection.update_one(
+            {"_id": article_id},
+            queue_push_update(scraping_url, priority, cost),
+            upsert=True,
+        )
+
+    def get(self) -> tuple[str, str]:
+        while True:
+            entry = self.collection.find_one_and_delete({}, sort=QUEUE_ORDER)
+            if entry:
+                return entry["_id"], entry["scraping_url"]
+            time.sleep(self.poll_interval)
+
+    def qsize(self) -> int:
+        return self.collection.count_documents({})
+
+    def position(self, article_id: str) -> int | None:
+        entry = self.collection.find_one({"_id": article_id})
+        if not entry:
+            return None
+        return self.collection.count_documents(queue_ahead_filter(entry))
+
+
+class AsyncArticleScheduler:
+    """The web side of `ArticleScheduler`, for use from async request
+    handlers. It shares the queue collection but only adds entries and
+    reports on them; articles are taken off by the synchronous scheduler in
+    the processing pipeline."""
+
+    def __init__(self, collection: pymongo.asynchronous.collection.AsyncCollection):
+        self.collection = collection
+
+    async def put(
+        self,
+        article_id: str,
+        scraping_url: str,
+        priority: int = PRIORITY_REFRESH,
+        cost: int = 0,
+    ) -> None:
+        await self.collection.update_one(
+            {"_id": article_id},
+            queue_push_update(scraping_url, priority, cost),
+            upsert=True,
+        )
+
+    async def qsize(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def position(self, article_id: str) -> int | None:
+        entry = await self.collection.find_one({"_id": article_id})
+        if not entry:
+            return None
+        return await self.collection.count_documents(queue_ahead_filter(entry))
@@ -0,0 +1,136 @@
+import gzip
+import mimetypes
+import os
+import pathlib
+
+import brotli
+import regex
+import starlette.datastructures
+import starlette.responses
+import starlette.staticfiles
+import starlette.types
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+# Store blobs and article artifacts are named by a hash of their content, so
+# what is behind such a URL never changes
+HASHED_NAME = regex.compile(r"(?:^|[./])[0-9a-f]{16,}\.[^/]*$")
+
+COMPRESSIBLE = [
+    ".css",
+    ".eot",
+    ".gif",
+    ".html",
+    ".ico",
+    ".js",
+    ".json",
+    ".otf",
+    ".svg",
+    ".ttf",
+    ".txt",
+    ".webmanifest",
+]
+# In order of preference
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+# Variants that save less than this are not worth a second file
+MIN_SAVING = 0.1
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return bytes(brotli.compress(data, quality=11))
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def precompress(root: pathlib.Path) -> int:
+    """Write .br and .gz variants next to the compressible files under
+    `root` where they are missing or older than the file. Returns how many
+    were written."""
+    written = 0
+    for path in root.rglob("*"):
+        if path.suffix not in COMPRESSIBLE or not path.is_file():
+            continue
+        mtime = path.stat().st_mtime
+        data = None
+        for encoding, suffix in ENCODINGS.items():
+            variant = path.with_name(path.name + suffix)
+            if variant.exists() and variant.stat().st_mtime >= mtime:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            compressed = compress(data, encoding)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                variant.unlink(missing_ok=True)
+                continue
+            tmp_path = variant.with_name(f".{variant.name}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(compressed)
+            os.replace(tmp_path, variant)
+            written += 1
+    return written
+
+
+def accepted_encodings(header: str) -> set[str]:
+    encodings = set()
+    for item in header.split(","):
+        name, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    pass
+        if q > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class CachedStaticFiles(starlette.staticfiles.StaticFiles):
+    """StaticFiles that marks content-hashed files immutable, lets everything
+    else be cached but revalidated, and serves precompressed variants made by
+    `precompress` to clients that accept them."""
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike[str],
+        stat_result: os.stat_result,
+        scope: starlette.types.Scope,
+        status_code: int = 200,
+    ) -> starlette.responses.Response:
+        request_headers = starlette.datastructures.Headers(scope=scope)
+        path = os.fspath(full_path)
+        headers = {
+            "Cache-Control": IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE
+        }
+
+        response = None
+        if os.path.splitext(path)[1] in COMPRESSIBLE:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+            for encoding, suffix in ENCODINGS.items():
+                if encoding not in accepted:
+                    continue
+                try:
+                    variant_stat = os.stat(path + suffix)
+                except FileNotFoundError:
+                    continue
+                if variant_stat.st_mtime < stat_result.st_mtime:
+                    continue
+                response = starlette.responses.FileResponse(
+                    path + suffix,
+                    status_code=status_code,
+                    headers={**headers, "Content-Encoding": encoding},
+                    media_type=mimetypes.guess_type(path)[0] or "text/plain",
+                    stat_result=variant_stat,
+                )
+                break
+
+        if response is None:
+            response = starlette.responses.FileResponse(
+                path, status_code=status_code, headers=headers, stat_result=stat_result
+            )
+        if self.is_not_modified(response.headers, request_headers):
+            return starlette.staticfiles.NotModifiedResponse(response.headers)
+        return response
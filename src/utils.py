@@ -1,8 +1,31 @@
+import datetime
+import email.utils
 import os
 import pathlib
+import typing
+
+import markdownify
+import pymongo
 
 DB_DIR = pathlib.Path(os.environ["DB_DIR"])
 
+# Categories are matched case-insensitively, the query must use the same
+# collation for the index to apply
+CATEGORY_COLLATION = {"locale": "en", "strength": 2}
+
+# Indexes on the manuscripts collection, shared by the generator and the
+# podcast feed and created by both at startup
+MANUSCRIPT_INDEXES = [
+    pymongo.IndexModel([("state", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]),
+    pymongo.IndexModel([("group", pymongo.ASCENDING)]),
+    pymongo.IndexModel(
+        [("categories", pymongo.ASCENDING)],
+        name="categories_ci",
+        collation=CATEGORY_COLLATION,
+    ),
+    pymongo.IndexModel([("lastmod", pymongo.DESCENDING)]),
+]
+
 
 def url_to_path(url: str) -> pathlib.Path:
     url = url.replace("%3F", "?")
@@ -10,3 +33,66 @@ def url_to_path(url: str) -> pathlib.Path:
         return DB_DIR / url.replace("/db/", "", 1)
     else:
         raise Exception(f'Do not know how to convert url "{url}" to path')
+
+
+def episode_summaries(manuscript: dict) -> tuple[str, str]:
+    """The podcast episode summary of `manuscript` (its first paragraph) and
+    long summary (every section as markdown)."""
+    summary = next(
+        (
+            " ".join(span["text"] for span in section["spans"]).strip()
+            for section in manuscript["sections"]
+            if section["section_type"] == "p"
+        ),
+        "",
+    )
+    long_summary = markdownify.markdownify(
+        "".join(
+            f"<{section["section_type"]}>{" ".join(span["text"] for span in section["spans"]).strip()}</{section["section_type"]}>"
+            for section in manuscript["sections"]
+        )
+    )
+    return summary, long_summary
+
+
+def http_date(timestamp: datetime.datetime) -> str:
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.UTC)
+    return email.utils.format_datetime(timestamp.astimezone(datetime.UTC), usegmt=True)
+
+
+def not_modified(
+    headers: typing.Mapping[str, str],
+    etag: str | None,
+    last_modified: datetime.datetime | None = None,
+) -> bool:
+    """Whether a conditional GET with these request headers can be answered
+    with 304 Not Modified (RFC 9110 13.1). If-None-Match takes precedence
+    over If-Modified-Since."""
+    if "if-none-match" in headers:
+        tags = [
+            t.strip().removeprefix("W/") for t in headers["if-none-match"].split(",")
+        ]
+        return etag is not None and ("*" in tags or etag in tags)
+    if last_modified and "if-modified-since" in headers:
+        try:
+            since = email.utils.parsedate_to_datetime(headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.UTC)
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=datetime.UTC)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def cache_headers(
+    etag: str,
+    last_modified: datetime.datetime | None = None,
+    cache_control: str = "public, no-cache",
+) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
@@ -6,6 +6,11 @@ let playback_rate = 1.0;
 let start_delay = 0;
 let TIMEOUTS = [];
 let CURRENT_AUDIOS = [];
+// Single-file playback: the word timeline of the complete audio, the span
+// element id of every word in it, and the highlighted one
+let TIMELINE = null;
+let highlight_frame = null;
+let highlighted_span = null;
 
 function my_highlight(span, length) {
   if (is_playing) {
@@ -23,8 +28,56 @@ function my_highlight(span, length) {
   }
 }
 
+// Index of the last word starting at or before `ms`, or -1
+function timeline_index(ms) {
+  let lo = 0;
+  let hi = TIMELINE.start.length;
+  while (lo < hi) {
+    let mid = (lo + hi) >> 1;
+    if (TIMELINE.start[mid] <= ms) {
+      lo = mid + 1;
+    } else {
+      hi = mid;
+    }
+  }
+  return lo - 1;
+}
+
+function set_highlighted_span(span) {
+  if (span == highlighted_span) {
+    return;
+  }
+  if (highlighted_span) {
+    document.getElementById(highlighted_span).classList.remove("active_span");
+  }
+  if (span) {
+    let elem = document.getElementById(span);
+    elem.classList.add("active_span");
+    elem.scrollIntoView({
+      behavior: "smooth",
+      block: "center",
+      inline: "center",
+    });
+  }
+  highlighted_span = span;
+}
+
+function follow_timeline() {
+  let ms = audio_playing.currentTime * 1000;
+  let i = timeline_index(ms);
+  set_highlighted_span(
+    i >= 0 && ms < TIMELINE.start[i] + TIMELINE.length[i]
+      ? TIMELINE.ids[i]
+      : null,
+  );
+  highlight_frame = requestAnimationFrame(follow_timeline);
+}
+
 function start_highlights(audios) {
-  if (audios.length) {
+  if (TIMELINE) {
+    cancelAnimationFrame(highlight_frame);
+    follow_timeline();
+  } else if (audios.length) {
     for (let i = 0; i < audios[0][0].length; i++) {
       let timeout =
         (audios[0][1][i].start - audio_playing.currentTime * 1000) /
@@ -48,6 +101,43 @@ function clear_highlights() {
     clearTimeout(h);
   }
   TIMEOUTS = [];
+  if (TIMELINE) {
+    cancelAnimationFrame(highlight_frame);
+    set_highlighted_span(null);
+  }
+}
+
+// Play the complete audio as one range-streamed file, highlighting words
+// from the timeline
+function play_single(audio_url, timeline) {
+  TIMELINE = timeline;
+  audio_playing = new Audio(audio_url);
+  audio_playing.preload = "metadata";
+  audio_playing.playbackRate = playback_rate;
+  audio_playing.addEventListener("ended", () => {
+    pausePlayback();
+    audio_playing.currentTime = 0;
+  });
+}
+
+function seek_section(section_index) {
+  audio_playing.currentTime = TIMELINE.section_start[section_index] / 1000;
+  if (is_playing) {
+    audio_playing.play();
+    start_highlights();
+  }
+}
+
+async function loadTimeline(manuscript) {
+  if (
+    manuscript.state != "done" ||
+    !manuscript.complete_audio_url ||
+    !manuscript.timeline_url
+  ) {
+    return null;
+  }
+  let response = await fetch(manuscript.timeline_url);
+  return response.ok ? await response.json() : null;
 }
 
 async function my_play(audios, outro) {
@@ -159,6 +249,25 @@ function pausePlayback() {
   }
 }
 
+// Alignment of every section, in section order. Finished articles have them
+// bundled in one file; otherwise the sections' own files are fetched in
+// parallel.
+async function loadAlignments(manuscript) {
+  if (manuscript.alignments_url) {
+    let response = await fetch(manuscript.alignments_url);
+    if (response.ok) {
+      return await response.json();
+    }
+  }
+  return await Promise.all(
+    manuscript.sections.map(async (section) =>
+      section.alignment_url && section.audio_url
+        ? await (await fetch(section.alignment_url)).json()
+        : null,
+    ),
+  );
+}
+
 async function populateManuscriptContent(manuscript) {
   let article_content = document.querySelector("#article-content");
   article_content.innerHTML = "";
@@ -168,6 +277,15 @@ async function populateManuscriptContent(manuscript) {
     if (manuscript.progress == 0) {
       progress.innerText = `Waiting - Article still in queue...`;
       article_content.appendChild(progress);
+      fetch(`/api/queue/${p_name}`)
+        .then((response) => response.json())
+        .then((queue) => {
+          if (queue.position !== null) {
+            progress.innerText = `Waiting - Article still in queue (${
+              queue.position
+            } of ${queue.depth} articles ahead)...`;
+          }
+        });
     } else {
       progress.innerText = `Generating article - ${(
         manuscript.progress * 100
@@ -178,8 +296,12 @@ async function populateManuscriptContent(manuscript) {
 
   let audios = [];
   let i = 0;
+  let section_ids = [];
+  let timeline = await loadTimeline(manuscript);
+  let alignments = timeline ? null : await loadAlignments(manuscript);
 
-  for (const section of manuscript.sections) {
+  for (const [section_index, section] of manuscript.sections.entries()) {
+    section_ids.push(i);
     let section_elem = document.createElement(section.section_type);
     if (section.section_type == "img") {
       section_elem.src = section.src;
@@ -189,6 +311,10 @@ async function populateManuscriptContent(manuscript) {
       section_elem.id = i;
       section_elem.title = "Start audio from this section";
       section_elem.onclick = (e) => {
+        if (TIMELINE) {
+          seek_section(section_index);
+          return;
+        }
         if (audio_playing) {
           audio_playing.pause();
           audio_playing.currentTime = 0;
@@ -218,10 +344,10 @@ async function populateManuscriptContent(manuscript) {
         span_elem.id = span_id;
         section_elem.appendChild(span_elem);
       }
-      if (section.alignment_url && section.audio_url) {
+      if (alignments && alignments[section_index] && section.audio_url) {
         audios.push([
           span_ids,
-          await (await fetch(section.alignment_url)).json(),
+          alignments[section_index],
           new Audio(section.audio_url),
         ]);
       }
@@ -251,7 +377,13 @@ async function populateManuscriptContent(manuscript) {
     document.querySelector("#pause-btn").classList.add("audio-button-active");
   }
   is_playing = false;
-  if (manuscript.outro && manuscript.outro.audio_url) {
+  if (timeline) {
+    let pad = (n) => String(n).padStart(4, "0");
+    timeline.ids = timeline.section.map(
+      (s, k) => `${pad(section_ids[s])}_${pad(timeline.span[k])}`,
+    );
+    play_single(manuscript.complete_audio_url, timeline);
+  } else if (manuscript.outro && manuscript.outro.audio_url) {
     my_play(audios, new Audio(manuscript.outro.audio_url));
   }
 }